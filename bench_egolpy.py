@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks for egolpy
+
+Times StateMap construction, Game.propagate (gol1.txt with
+gol.rules and 4gol.txt with 4gol.rules, using every available
+engine) and StateMap.save/load (JSON and binary snapshots) over
+a range of grid sizes and live cell densities. Throughput is
+reported in cells per second and written as JSON, e.g.:
+
+    python bench_egolpy.py -o bench_output.json
+    python bench_egolpy.py -o new.json --compare bench_output.json
+"""
+
+from __future__ import division, print_function
+
+import os
+import sys
+import json
+import random
+import tempfile
+import platform
+import subprocess
+import timeit
+
+from egolpy_core import StateMap, Gol, engines
+from egolpy_rules import load_rule_file
+
+if sys.version[0] == '3':
+    xrange = range
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# (case name, rule file, state file, largest_neighbour_distance)
+PROPAGATE_CASES = [('gol', 'gol.rules', 'gol1.txt', 1),
+                   ('4gol', '4gol.rules', '4gol.txt', 2)]
+
+
+def best_time(func, repeat):
+    """ Returns the shortest wall time of `repeat` calls to func """
+    times = []
+    for i in xrange(repeat):
+        start = timeit.default_timer()
+        func()
+        times.append(timeit.default_timer() - start)
+    return min(times)
+
+
+def tiled_pattern(state_file, nx, ny):
+    """ The pattern of state_file repeated (or cropped) to nx*ny """
+    rows = json.load(open(os.path.join(ROOT, state_file), 'rt'))
+    return [rows[y % len(rows)][x % len(rows[0])] for y in xrange(ny)
+            for x in xrange(nx)]
+
+
+def random_pattern(states, default_state, nx, ny, density, seed=42):
+    """ Random board with a fraction `density` of non-default cells """
+    rnd = random.Random(seed)
+    live_states = [s for s in states if s != default_state]
+    return [rnd.choice(live_states) if rnd.random() < density
+            else default_state for i in xrange(nx*ny)]
+
+
+def get_density(data, default_state=0):
+    return sum([1 for s in data if s != default_state])/len(data)
+
+
+def bench_statemap_init(sizes, distances, repeat):
+    results = []
+    for nx in sizes:
+        for nth in distances:
+            seconds = best_time(lambda: StateMap(
+                nx, nx, largest_neighbour_distance=nth), repeat)
+            results.append({'benchmark': 'statemap_init', 'nx': nx,
+                            'ny': nx, 'largest_neighbour_distance': nth,
+                            'seconds': seconds,
+                            'cells_per_second': nx*nx/seconds})
+    return results
+
+
+def close_engine(game):
+    """ Stop e.g. the worker processes of an engine """
+    if hasattr(game._engine, 'close'):
+        game._engine.close()
+
+
+def bench_propagate(sizes, densities, engine_names, generations, repeat):
+    results = []
+    for case, rule_file, state_file, nth in PROPAGATE_CASES:
+        rules = load_rule_file(os.path.join(ROOT, rule_file))[0]
+        for nx in sizes:
+            patterns = [('file', tiled_pattern(state_file, nx, nx))]
+            for density in densities:
+                patterns.append(('random', random_pattern(
+                    rules.keys(), 0, nx, nx, density)))
+            for source, data in patterns:
+                for engine in engine_names:
+                    try:
+                        close_engine(Gol(nx, nx, [], True, rules,
+                                         engine=engine))
+                    except ValueError as e:
+                        print('Skipping engine %s for %s (%s)' % (
+                            engine, case, e))
+                        continue
+                    def run():
+                        game = Gol(nx, nx, [], True, rules,
+                                   largest_neighbour_distance=nth,
+                                   engine=engine)
+                        game._state._data = data[:]
+                        start = timeit.default_timer()
+                        for generation in xrange(generations):
+                            game.propagate()
+                        run.seconds = timeit.default_timer() - start
+                        close_engine(game)
+                    best = []
+                    for i in xrange(repeat):
+                        run()
+                        best.append(run.seconds)
+                    seconds = min(best)
+                    results.append({
+                        'benchmark': 'propagate', 'case': case,
+                        'engine': engine or 'python', 'source': source,
+                        'nx': nx, 'ny': nx,
+                        'density': round(get_density(data), 4),
+                        'generations': generations, 'seconds': seconds,
+                        'cells_per_second': nx*nx*generations/seconds})
+    return results
+
+
+# (format name, file suffix, compression)
+SAVE_FORMATS = [('json', '.txt', None), ('binary', '.egol', None),
+                ('zlib', '.egol', 'zlib'), ('rle', '.egol', 'rle')]
+
+
+def bench_save_load(sizes, densities, repeat):
+    results = []
+    for fmt, suffix, compression in SAVE_FORMATS:
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        try:
+            for nx in sizes:
+                state_map = StateMap(nx, nx)
+                for density in densities:
+                    state_map._data = random_pattern([0, 1], 0, nx, nx,
+                                                     density)
+                    for name, func in (
+                            ('save', lambda: state_map.save(path,
+                                                            compression)),
+                            ('load', lambda: state_map.load(path))):
+                        seconds = best_time(func, repeat)
+                        results.append({'benchmark': name, 'format': fmt,
+                                        'nx': nx, 'ny': nx,
+                                        'density': density,
+                                        'seconds': seconds,
+                                        'cells_per_second': nx*nx/seconds})
+        finally:
+            os.remove(path)
+    return results
+
+
+def get_available_engines(requested=None):
+    names = [None] + sorted(engines.keys())
+    available = []
+    for name in names:
+        if requested and (name or 'python') not in requested:
+            continue
+        if name is not None:
+            try:
+                __import__(engines[name][0])
+            except ImportError as e:
+                print('Skipping engine %s (%s)' % (name, e))
+                continue
+        available.append(name)
+    return available
+
+
+def get_meta():
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+            stderr=subprocess.STDOUT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(),
+            'platform': platform.platform()}
+
+
+def result_key(result):
+    return tuple(sorted([(k, v) for k, v in result.items() if k not in
+                         ('seconds', 'cells_per_second')]))
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the throughput ratio against baseline results,
+    returns the number of regressions (ratio < 1 - tolerance)
+    """
+    old = dict([(result_key(r), r) for r in baseline['results']])
+    regressions = 0
+    for result in results:
+        key = result_key(result)
+        if not key in old:
+            continue
+        ratio = result['cells_per_second']/old[key]['cells_per_second']
+        flag = ''
+        if ratio < 1 - tolerance:
+            flag = '  REGRESSION'
+            regressions += 1
+        print('%-60s %8.2fx%s' % (describe(result), ratio, flag))
+    return regressions
+
+
+def describe(result):
+    return ' '.join(['%s=%s' % (k, v) for k, v in result_key(result)
+                     if k != 'generations'])
+
+
+def main(sizes=(40, 80, 160), densities=(0.05, 0.2, 0.4),
+         distances=(1, 2, 4), generations=5, repeat=3, engine=None,
+         output='', baseline='', tolerance=0.1):
+    engine_names = get_available_engines(engine)
+    results = []
+    results += bench_statemap_init(sizes, distances, repeat)
+    results += bench_propagate(sizes, densities, engine_names,
+                               generations, repeat)
+    results += bench_save_load(sizes, densities, repeat)
+    for result in results:
+        print('%-60s %14.0f cells/s' % (describe(result),
+                                       result['cells_per_second']))
+    data = {'meta': get_meta(), 'results': results}
+    if output != '':
+        json.dump(data, open(output, 'wt'), indent=1)
+    if baseline != '':
+        return compare(results, json.load(open(baseline, 'rt')), tolerance)
+    return 0
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-x', '--sizes', type=int, nargs='+',
+                        default=[40, 80, 160],
+                        help="Grid sizes (square grids)")
+    parser.add_argument('-d', '--densities', type=float, nargs='+',
+                        default=[0.05, 0.2, 0.4],
+                        help="Live cell densities of random boards")
+    parser.add_argument('-n', '--distances', type=int, nargs='+',
+                        default=[1, 2, 4],
+                        help="largest_neighbour_distance values for"
+                        " StateMap construction")
+    parser.add_argument('-g', '--generations', type=int, default=5,
+                        help="Generations per propagate benchmark")
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help="Repetitions (best time is kept)")
+    parser.add_argument('-e', '--engine', type=str, nargs='+',
+                        default=None,
+                        help="Engines to benchmark (default: all, the"
+                        " plain loop is called python)")
+    parser.add_argument('-o', '--output', type=str, default='',
+                        help="JSON file to write results to")
+    parser.add_argument('-c', '--compare', dest='baseline', type=str,
+                        default='', help="JSON results to compare with")
+    parser.add_argument('-t', '--tolerance', type=float, default=0.1,
+                        help="Relative slowdown reported as regression")
+    args = parser.parse_args()
+    sys.exit(1 if main(**vars(args)) else 0)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Startup benchmark for egolpy
+
+Imports each module in a fresh interpreter (as every worker process
+does) and times the import. Fails when the best time of a module is
+over the budget, or when it pulls in a heavy optional dependency
+(pygame, numpy, ...) which should only be imported on first use, e.g.:
+
+    python bench_startup.py
+    python bench_startup.py -b 30 -m egolpy_core egolpy_rules
+"""
+
+from __future__ import division, print_function
+
+import os
+import sys
+import json
+import subprocess
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Modules which must not be imported by importing the module itself
+LAZY_MODULES = ('pygame', 'numpy', 'numba', 'multiprocessing', 'json',
+                'egolpy_snapshot', 'egolpy_history', 'egolpy_classes')
+
+MODULES = ('egolpy_core', 'egolpy_rules')
+
+SCRIPT = """
+import sys
+from timeit import default_timer as clock
+start = clock()
+import %s
+seconds = clock() - start
+lazy_loaded = [m for m in %r if m in sys.modules and m != %r]
+import json
+print(json.dumps({'seconds': seconds, 'lazy_loaded': lazy_loaded}))
+"""
+
+
+def time_import(module, lazy_modules=LAZY_MODULES):
+    """
+    Imports module in a new interpreter, returns the seconds taken
+    and the lazy modules which got imported
+    """
+    env = dict(os.environ)
+    # Measure with the bytecode cached, as it is once installed
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    output = subprocess.check_output(
+        [sys.executable, '-c', SCRIPT % (module, tuple(lazy_modules), module)],
+        cwd=ROOT, env=env)
+    result = json.loads(output.decode().strip().splitlines()[-1])
+    return result['seconds'], result['lazy_loaded']
+
+
+def main(modules=MODULES, budget=50, repeat=5):
+    failures = 0
+    for module in modules:
+        time_import(module) # Warm up (writes the bytecode cache)
+        times, lazy_loaded = [], set()
+        for i in range(repeat):
+            seconds, loaded = time_import(module)
+            times.append(seconds)
+            lazy_loaded.update(loaded)
+        best = min(times)*1000
+        flag = ''
+        if best > budget:
+            flag += '  OVER BUDGET (%g ms)' % budget
+        if lazy_loaded:
+            flag += '  IMPORTS %s' % ', '.join(sorted(lazy_loaded))
+        if flag:
+            failures += 1
+        print('%-20s %8.1f ms%s' % (module, best, flag))
+    return failures
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-m', '--modules', type=str, nargs='+',
+                        default=list(MODULES), help="Modules to import")
+    parser.add_argument('-b', '--budget', type=float, default=50,
+                        help="Cold import budget per module in ms")
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help="Repetitions (best time is kept)")
+    args = parser.parse_args()
+    sys.exit(1 if main(**vars(args)) else 0)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Equivalence check of the egolpy engines
+
+Propagates gol1.txt with gol.rules and the std rules, 4gol.txt with
+4gol.rules, an empty board with a rule reaching two shells out
+(while largest_neighbour_distance is 1) and random boards with each
+of these rules, using the plain Python loop, engine='auto' and every
+available engine. After the first generation a cell is changed, as
+by a click, so that the frontier is exercised as well. Every
+generation is compared with a straightforward reference step which
+shares no code with egolpy. Fails on the first difference, e.g.:
+
+    python check_engines.py
+    python check_engines.py -g 20 -e python numpy
+"""
+
+from __future__ import division, print_function
+
+import os
+import sys
+import json
+import random
+
+from egolpy_core import Gol, engines
+from egolpy_rules import load_rule_file
+
+if sys.version[0] == '3':
+    xrange = range
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Cells with a state 1 cell in their second shell become 1
+RADIUS_2_RULES = {0: ([(2, 3, 1, {1: 1})], 0), 1: ([], 1)}
+
+# (case name, rule file (None: the std rules) or rules, state file
+# (None: an empty board), largest_neighbour_distance)
+CASES = [('gol', 'gol.rules', 'gol1.txt', 1),
+         ('4gol', '4gol.rules', '4gol.txt', 2),
+         ('std', None, 'gol1.txt', 1),
+         ('radius2', RADIUS_2_RULES, None, 1)]
+
+
+def get_shell(x, y, nth, nx, ny):
+    """ The distinct cells in neighbour shell nth of (x, y), wrapping """
+    cells = set()
+    for dx in xrange(-nth, nth+1):
+        for dy in xrange(-nth, nth+1):
+            if max(abs(dx), abs(dy)) == nth:
+                cells.add(((x+dx) % nx, (y+dy) % ny))
+    return cells
+
+
+def reference_step(data, nx, ny, rules):
+    """ The next generation of data (row by row) on a periodic board """
+    new = data[:]
+    for y in xrange(ny):
+        for x in xrange(nx):
+            state_rules, default_outcome = rules[data[y*nx+x]]
+            new_state = default_outcome
+            for i0, ie, match, outcome in state_rules:
+                nr = sum([1 for nth in xrange(i0, ie)
+                          for cx, cy in get_shell(x, y, nth, nx, ny)
+                          if data[cy*nx+cx] == match])
+                if nr in outcome:
+                    new_state = outcome[nr]
+                    break
+            new[y*nx+x] = new_state
+    return new
+
+
+def get_rules(source):
+    if source is None:
+        return Gol.std_rules
+    if isinstance(source, dict):
+        return source
+    return load_rule_file(os.path.join(ROOT, source))[0]
+
+
+def get_boards(state_file, states, size, density, seed=42):
+    """ [(source, data, nx, ny)] of the state file and a random board """
+    if state_file is None:
+        boards = [('empty', [0]*(size*size), size, size)]
+    else:
+        rows = json.load(open(os.path.join(ROOT, state_file), 'rt'))
+        boards = [('file', [s for row in rows for s in row], len(rows[0]),
+                   len(rows))]
+    rnd = random.Random(seed)
+    live_states = [s for s in states if s != 0]
+    boards.append(('random', [rnd.choice(live_states)
+                              if rnd.random() < density else 0
+                              for i in xrange(size*size)], size, size))
+    return boards
+
+
+def get_available_engines(requested=None):
+    names = [None, 'auto'] + sorted(engines.keys())
+    available = []
+    for name in names:
+        if requested and (name or 'python') not in requested:
+            continue
+        if name in engines:
+            try:
+                __import__(engines[name][0])
+            except ImportError as e:
+                print('Skipping engine %s (%s)' % (name, e))
+                continue
+        available.append(name)
+    return available
+
+
+def check(rules, data, nx, ny, nth, engine, generations):
+    """
+    Returns the first generation differing from the reference (0 if
+    none), raises ValueError if the engine does not take the rules
+    """
+    game = Gol(nx, ny, [], True, rules, largest_neighbour_distance=nth,
+               engine=engine)
+    try:
+        game._state.redefine_region(0, 0, nx, data)
+        expected = data[:]
+        edit = (nx//2, ny//2, max(rules.keys()))
+        for generation in xrange(1, generations+1):
+            game.propagate()
+            expected = reference_step(expected, nx, ny, rules)
+            if list(game._state._data) != expected:
+                return generation
+            if generation == 1:
+                x, y, state = edit
+                game._state.redefine(x, y, state)
+                expected[y*nx+x] = state
+        return 0
+    finally:
+        if hasattr(game._engine, 'close'):
+            game._engine.close()
+
+
+def main(generations=10, size=24, density=0.3, engine=None):
+    engine_names = get_available_engines(engine)
+    failures = 0
+    for case, rule_source, state_file, nth in CASES:
+        rules = get_rules(rule_source)
+        for source, data, nx, ny in get_boards(state_file, rules.keys(),
+                                               size, density):
+            for name in engine_names:
+                try:
+                    generation = check(rules, data, nx, ny, nth, name,
+                                       generations)
+                except ValueError as e:
+                    print('Skipping engine %s for %s (%s)' % (name, case, e))
+                    continue
+                result = 'ok'
+                if generation:
+                    result = 'MISMATCH at generation %d' % generation
+                    failures += 1
+                print('%-8s %-7s %-9s %s' % (case, source, name or 'python',
+                                              result))
+    return failures
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-g', '--generations', type=int, default=10,
+                        help="Generations compared per case")
+    parser.add_argument('-x', '--size', type=int, default=24,
+                        help="Size of the random and empty (square) boards")
+    parser.add_argument('-d', '--density', type=float, default=0.3,
+                        help="Fraction of non-default cells of random boards")
+    parser.add_argument('-e', '--engine', type=str, nargs='+',
+                        default=None,
+                        help="Engines to check (default: all, the plain"
+                        " loop is called python)")
+    args = parser.parse_args()
+    sys.exit(1 if main(**vars(args)) else 0)
@@ -12,18 +12,11 @@ This project is open source and is released under the
 
 from __future__ import division
 
-import sys, pygame, os
-from itertools import product
+import sys, os, time
+import atexit
 import logging
-from egolpy_classes import GamePlan
-
-if sys.version[0] == '3':
-    imap = map
-    xrange = range
-    import pickle
-else:
-    from itertools import imap
-    import cPickle as pickle
+from egolpy_core import Gol
+from egolpy_rules import load_rule_file
 
 import argparse
 
@@ -31,37 +24,164 @@ logging.basicConfig()
 logger = logging.getLogger('egol')
 logger.setLevel(logging.DEBUG)
 
+def get_rules(rule_file):
+    """
+    Returns (rules, colormap, button_action_map) from rule_file,
+    (None, None, None) means the std GOL rules
+    """
+    if rule_file != '':
+        if os.path.exists(rule_file):
+            return load_rule_file(rule_file)
+        else:
+            logger.debug('Couldn\'t open: %s. Using std GOL rules',
+                         rule_file)
+    return None, None, None
+
+
+def get_engine_options(engine, workers):
+    """
+    Returns (engine, engine_options), giving a number of
+    workers selects the parallel engine
+    """
+    if engine == 'python':
+        engine = None
+    if workers is None:
+        return engine, None
+    if engine == 'auto':
+        engine = 'parallel'
+    if engine != 'parallel':
+        logger.debug('Ignoring number of workers for engine: %s', engine)
+        return engine, None
+    return engine, {'workers': workers}
+
+
+def run_headless(nxcells=40, nycells=40, periodic=True,
+                 load_file='', save_file='', rule_file='',
+                 largest_neighbour_distance=1, engine='auto',
+                 generations=100, compact=False, workers=None,
+                 on_cycle=None, history=None, export_history='',
+                 compression=None, instrument=None, unbounded=False,
+                 census=False):
+    """
+    Propagate `generations` generations back to back without
+    any graphical output (pygame is never imported)
+    """
+    rules, colormap, button_action_map = get_rules(rule_file)
+    engine, engine_options = get_engine_options(engine, workers)
+    game = Gol(nxcells, nycells, [], periodic, rules, colormap,
+               button_action_map, largest_neighbour_distance, engine,
+               compact, engine_options, unbounded)
+    if load_file != '':
+        if os.path.exists(load_file): game.load(load_file)
+
+    if on_cycle is not None:
+        game.detect_cycles()
+    if history is not None:
+        game.keep_history(max_bytes=int(history*2**20))
+    if instrument is not None:
+        from egolpy_instrument import get_collector
+        game.instrument(get_collector(instrument))
+
+    start = time.time()
+    generations = game.run(generations, on_cycle)
+    elapsed = time.time() - start
+    logger.info('%d generations in %.3f s (%.2f generations/s)',
+                generations, elapsed,
+                generations/elapsed if elapsed > 0 else float('inf'))
+    if game.cycle is not None:
+        logger.info('Cycle with period %d from generation %d',
+                    game.cycle[1], game.cycle[0])
+
+    if instrument is not None:
+        game.instrument() # flush and close the collector
+    if census:
+        logger.info('Census: %s', ', '.join([
+            '%d %s' % (n, name) for name, n in game.census().most_common()]))
+    if save_file != '':
+        game.save(save_file, compression)
+    if history is not None and export_history != '':
+        kept = game.export_history(0, game.generation, export_history)
+        logger.info('Exported %d generations (%s to %s)', len(kept),
+                    kept[0], kept[-1])
+    return game
+
+
+def run_server(nxcells=40, nycells=40, periodic=True, load_file='',
+               rule_file='', largest_neighbour_distance=1, engine='auto',
+               compact=False, workers=None, port=7474, interval=0.25):
+    """
+    Propagate headless forever, streaming the generations to
+    clients connecting to `port` (see egolpy_server)
+    """
+    import asyncio
+    from egolpy_server import SimulationServer
+    rules, colormap, button_action_map = get_rules(rule_file)
+    engine, engine_options = get_engine_options(engine, workers)
+    game = Gol(nxcells, nycells, [], periodic, rules, colormap,
+               button_action_map, largest_neighbour_distance, engine,
+               compact, engine_options)
+    if load_file != '':
+        if os.path.exists(load_file): game.load(load_file)
+    server = SimulationServer(game, port=port, interval=interval)
+    try:
+        asyncio.run(server.run())
+    except KeyboardInterrupt:
+        pass
+    return game
+
+
 def main(nxcells=40, nycells=40, width=400, height=400,
          periodic=True, update_interval=250,
          load_file='', save_file='', rule_file='',
-         largest_neighbour_distance=1):
+         largest_neighbour_distance=1, engine='auto',
+         headless=False, generations=100, compact=False, workers=None,
+         on_cycle=None, history=None, export_history='',
+         compression=None, fps=30, max_speed=False, serve=None,
+         instrument=None, unbounded=False, census=False):
     """
     Main game
     """
+    if serve is not None:
+        return run_server(nxcells, nycells, periodic, load_file, rule_file,
+                          largest_neighbour_distance, engine, compact,
+                          workers, serve, update_interval/1000)
+    if headless or unbounded:
+        return run_headless(nxcells, nycells, periodic, load_file,
+                            save_file, rule_file,
+                            largest_neighbour_distance, engine,
+                            generations, compact, workers, on_cycle,
+                            history, export_history, compression,
+                            instrument, unbounded, census)
+
+    import pygame
+    from egolpy_classes import GamePlan
+
     pygame.init()
 
     size = width, height
 
-    rules, colormap, button_action_map = None, None, None
-
-    if rule_file != '':
-        if os.path.exists(rule_file):
-            rules, colormap, button_action_map = pickle.load(\
-                open(rule_file, 'rb'))
-        else:
-            logger.debug('Couldn\'t open: %s. Using std GOL rules',
-                         rule_file)
+    rules, colormap, button_action_map = get_rules(rule_file)
+    engine, engine_options = get_engine_options(engine, workers)
 
     game_plan = GamePlan((nxcells,nycells), size,
                    pbc=periodic, rules=rules, colormap=colormap,
                    button_action_map=button_action_map,
-                   largest_neighbour_distance=largest_neighbour_distance)
+                   largest_neighbour_distance=largest_neighbour_distance,
+                   engine=engine, compact=compact,
+                   engine_options=engine_options)
 
     if load_file != '':
         if os.path.exists(load_file): game_plan.load(load_file)
+    if history is not None:
+        game_plan._game.keep_history(max_bytes=int(history*2**20))
+    if instrument is not None:
+        from egolpy_instrument import get_collector
+        game_plan.instrument(get_collector(instrument))
+        # Flush and close the collector on exit
+        atexit.register(game_plan.instrument)
+    worker = game_plan.start_worker(
+        0 if max_speed else update_interval/1000)
     clock = pygame.time.Clock()
-    tick = clock.tick()
-    paused = False
     while 1:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
@@ -77,28 +197,40 @@ def main(nxcells=40, nycells=40, width=400, height=400,
                 if event.key == pygame.K_p or \
                        event.key == pygame.K_SPACE:
                     # Puase / unpause game
-                    paused = not paused
+                    worker.paused = not worker.paused
                 elif event.key == pygame.K_s:
                     # Save state of game
-                    game_plan.save(save_file)
+                    game_plan.save(save_file, compression)
                 elif event.key == pygame.K_l:
                     # Save state of game
                     game_plan.load(load_file)
+                elif event.key == pygame.K_b and history is not None:
+                    # Step back one generation
+                    worker.paused = True
+                    game_plan.step_back()
+                elif event.key == pygame.K_n and worker.paused:
+                    # Step forward one generation
+                    game_plan.propagate()
+                elif event.key == pygame.K_e and history is not None \
+                         and export_history != '':
+                    # Export the kept generations
+                    game = game_plan._game
+                    with game_plan._lock:
+                        game.export_history(0, game.generation,
+                                            export_history)
+                elif event.key == pygame.K_m:
+                    # Toggle max speed
+                    worker.interval = update_interval/1000 \
+                                      if worker.interval == 0 else 0
                 elif event.key == pygame.K_q or \
                      event.key == pygame.K_ESCAPE:
                     sys.exit(0)
 
+        # The simulation runs in the worker thread, only the latest
+        # generation is drawn
+        game_plan.execute_clicks()
         game_plan.draw()
-        if paused:
-            game_plan.execute_clicks()
-        else:
-            tick += clock.tick()
-            if tick > update_interval:
-                game_plan.propagate()
-                tick = 0
-
-        pygame.time.wait(25)
-
+        clock.tick(fps)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description=__doc__)
@@ -120,9 +252,58 @@ if __name__ == '__main__':
                         help="Rule file to load")
     parser.add_argument('-u', '--update_interval', type=int, default=250,
                         help="Update interval in milliseconds")
+    parser.add_argument('-f', '--fps', type=int, default=30,
+                        help="Frames drawn per second (the simulation"
+                        " runs at its own rate)")
+    parser.add_argument('-m', '--max_speed', action="store_true",
+                        default=False,
+                        help="Propagate as fast as possible, drawing only"
+                        " the latest generation (toggled with m)")
     parser.add_argument('-n', '--largest_neighbour_distance',
                         type=int, default=250,
                         help="Largest neighbour distance used in rules.")
+    parser.add_argument('-e', '--engine', type=str, default='auto',
+                        help="Propagation engine (python, numpy, numba,"
+                        " bitlife, hashlife or parallel), by default the"
+                        " fastest one available for the rules")
+    parser.add_argument('--headless', action="store_true", default=False,
+                        help="Run without graphics, propagating back to back")
+    parser.add_argument('-g', '--generations', type=int, default=100,
+                        help="Number of generations to run in headless mode")
+    parser.add_argument('--on-cycle', type=str, default=None,
+                        choices=['stop', 'skip'],
+                        help="In headless mode, detect cycles and stop or"
+                        " skip whole periods")
+    parser.add_argument('-z', '--compression', type=str, default=None,
+                        choices=['zlib', 'rle'],
+                        help="Save a compressed binary snapshot (state"
+                        " files ending with .egol are always binary)")
+    parser.add_argument('--history', type=float, default=None,
+                        help="Keep past generations within this many MB"
+                        " (b steps back, n steps forward when paused)")
+    parser.add_argument('--export-history', type=str, default='',
+                        help="Save the kept generations to these files"
+                        " (e.g. gen_%%06d.txt) at the end of headless"
+                        " runs or when e is pressed")
+    parser.add_argument('-i', '--instrument', type=str, default=None,
+                        help="Collect per generation statistics: 'log' to"
+                        " log them, a .csv file or a JSON lines file")
+    parser.add_argument('--serve', type=int, default=None, metavar='PORT',
+                        help="Run headless, streaming the generations to"
+                        " TCP clients on this port (one generation every"
+                        " -u milliseconds)")
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help="Number of worker processes of the parallel"
+                        " engine (implies -e parallel)")
+    parser.add_argument('-c', '--compact', action="store_true", default=False,
+                        help="Store the game plan as one byte per cell")
+    parser.add_argument('--census', action="store_true", default=False,
+                        help="At the end of headless runs, count the"
+                        " objects by name of the motifs in motifs/")
+    parser.add_argument('-U', '--unbounded', action="store_true",
+                        default=False,
+                        help="Run headless on an unbounded plane (the"
+                        " Python loop, -x and -y are not used)")
 
     args = parser.parse_args()
     argd = vars(args) # Argument dictionary
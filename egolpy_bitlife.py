@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Bit-sliced engine for life-like (two-state B/S) rules, e.g.
+Gol.std_rules and gol.rules
+
+The game plan is packed into a single integer with one bit per
+cell (bit y*nx+x set for live cells). The eight neighbour boards
+are rotations of it and their sum is kept as four bit planes,
+built with bitwise adders, so a generation is a few dozen big
+integer operations and needs nothing but the standard library.
+"""
+
+from __future__ import division
+
+import sys
+
+from egolpy_rules import compile_rules, get_life_rule, classify_rules, \
+     LIFE_LIKE
+
+if sys.version[0] == '3':
+    xrange = range
+
+
+class BitLifeEngine(object):
+    """
+    Propagates a StateMap with life-like rules, giving the same
+    result as Game.propagate
+    """
+
+    def __init__(self, rules, nx, ny):
+        if classify_rules(rules) != LIFE_LIKE:
+            raise ValueError("BitLife needs two-state rules with a"
+                             " neighbour radius of 1")
+        if nx < 3 or ny < 3:
+            raise ValueError("BitLife needs a game plan of at least 3x3")
+        compiled = compile_rules(rules)
+        self._nx, self._ny = nx, ny
+        self._states = compiled.states
+        self._birth, self._survival = get_life_rule(compiled)
+        n = nx*ny
+        self._full = (1 << n) - 1
+        self._first_col = sum([1 << (y*nx) for y in xrange(ny)])
+        self._last_col = self._first_col << (nx-1)
+        # Bytes of the states -> '0'/'1'
+        table = bytearray(b'0'*256)
+        if self._states[1] < 256:
+            table[self._states[1]] = ord('1')
+        self._table = bytes(table)
+
+    def _equals(self, planes, count):
+        """ Board of the cells with `count` live neighbours """
+        full = self._full
+        result = full
+        for bit, plane in enumerate(planes):
+            result &= plane if count >> bit & 1 else full ^ plane
+        return result
+
+    def advance(self, board):
+        """ Returns board (an integer, see above) one generation later """
+        nx, n, full = self._nx, self._nx*self._ny, self._full
+        first_col, last_col = self._first_col, self._last_col
+        # Boards of the east and west neighbours (wrapping in rows)
+        east = (board >> 1 & (full ^ last_col)) | \
+               (board << (nx-1) & last_col)
+        west = (board << 1 & (full ^ first_col)) | \
+               (board >> (nx-1) & first_col)
+        neighbours = [east, west]
+        for row in (board, east, west):
+            # The rows above and below (wrapping)
+            neighbours.append((row << nx | row >> (n-nx)) & full)
+            neighbours.append((row >> nx | row << (n-nx)) & full)
+        # Sum the neighbour boards into bit planes
+        planes = [0, 0, 0, 0]
+        for neighbour in neighbours:
+            carry = neighbour
+            for bit in xrange(4):
+                if not carry:
+                    break
+                planes[bit], carry = planes[bit] ^ carry, planes[bit] & carry
+        born = 0
+        for count in self._birth:
+            born |= self._equals(planes, count)
+        survives = 0
+        for count in self._survival:
+            survives |= self._equals(planes, count)
+        return (born & (full ^ board)) | (survives & board)
+
+    def pack(self, data):
+        """ The board of data (states row by row) """
+        dead, live = self._states
+        if live < 256 and dead < 256:
+            raw = bytes(bytearray(data)).translate(self._table)
+        else:
+            raw = ''.join(['1' if state == live else '0' for state in data])
+        return int(raw[::-1], 2)
+
+    def propagate(self, state_map):
+        """
+        Propagates state_map one generation, the changed cells are
+        written in one go (see StateMap.redefine_cells)
+        """
+        board = self.pack(state_map._data)
+        new_board = self.advance(board)
+        n = self._nx*self._ny
+        new_bits = format(new_board, 'b').zfill(n)[::-1]
+        diff = format(board ^ new_board, 'b').zfill(n)[::-1]
+        dead, live = self._states
+        changes = []
+        idx = diff.find('1')
+        while idx != -1:
+            changes.append((idx, live if new_bits[idx] == '1' else dead))
+            idx = diff.find('1', idx+1)
+        state_map._redefine_indices(changes)
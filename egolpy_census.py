@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Object census for egolpy
+
+The cells not in the default state are split into connected
+components, cells at most `distance` apart (in both directions)
+being connected. By default distance is twice the neighbour radius
+of the rules, i.e. cells close enough to affect a common cell, so
+that e.g. the phases of a beacon or a pulsar stay one object.
+
+Components are named by looking up their canonical form in an index
+built from the motifs in motifs/ (see build_index): their cells
+(dy, dx, state) relative to the upper left corner, the smallest of
+the eight rotations and reflections. Each motif is indexed in every
+phase it goes through before it repeats, e.g. both phases of a
+blinker and all four of a glider:
+
+    census = Census(build_index(rules), 2)
+    census.update(state_map)    # Counter({'block': 12, 'blinker': 3})
+
+After the first update only the regions touched since (see
+Census.touch, called by Game.census) are looked at again.
+Components which are not in the index are counted as UNKNOWN.
+"""
+
+from __future__ import division
+
+import os
+import sys
+import glob
+import logging
+from collections import Counter
+from itertools import compress, count
+
+from egolpy_rules import get_rules_radius
+from egolpy_core import Game, ChunkedStateMap, MOTIF_DIR, get_pattern_cells
+
+if sys.version[0] == '3':
+    xrange = range
+
+logger = logging.getLogger('egol')
+
+UNKNOWN = 'unknown'
+
+# The rotations and reflections as (a, b, c, d): (x, y) -> (ax+by, cx+dy)
+SYMMETRIES = ((1, 0, 0, 1), (0, -1, 1, 0), (-1, 0, 0, -1), (0, 1, -1, 0),
+              (-1, 0, 0, 1), (0, 1, 1, 0), (1, 0, 0, -1), (0, -1, -1, 0))
+
+
+def normalize(cells):
+    """
+    The form of cells (x, y, state): a sorted tuple of (dy, dx, state)
+    relative to the upper left corner
+    """
+    x0 = min([x for x, y, state in cells])
+    y0 = min([y for x, y, state in cells])
+    return tuple(sorted([(y-y0, x-x0, state) for x, y, state in cells]))
+
+
+def get_orientations(cells):
+    """ The forms of cells in all eight orientations """
+    return [normalize([(a*x+b*y, c*x+d*y, state) for x, y, state in cells])
+            for a, b, c, d in SYMMETRIES]
+
+
+def canonical_form(cells):
+    """ The smallest form of cells (x, y, state) in any orientation """
+    return min(get_orientations(cells))
+
+
+def get_offsets(distance, nx):
+    """ (dx, dy, dy*nx+dx) of the cells connected to a cell """
+    return [(dx, dy, dy*nx+dx) for dy in xrange(-distance, distance+1)
+            for dx in xrange(-distance, distance+1) if dx or dy]
+
+
+def find_components(states, nx, ny, indices, distance, wrap=True):
+    """
+    Returns the connected components of the cells `indices` (y*nx+x,
+    with states[idx] their states) on an nx*ny grid, as lists of
+    (x, y, state). Coordinates of components crossing an edge run on
+    past it (if wrap), so the cells of a component are contiguous.
+    """
+    unseen = set(indices)
+    offsets = get_offsets(distance, nx)
+    # Away from the edges the neighbours are found by set operations
+    deltas = dict([(offset, (dx, dy)) for dx, dy, offset in offsets])
+    shifts = [offset for dx, dy, offset in offsets]
+    components = []
+    for start in indices:
+        if not start in unseen:
+            continue
+        unseen.discard(start)
+        x, y = start % nx, start // nx
+        component = [(x, y, states[start])]
+        stack = [(start, x, y)]
+        while stack:
+            idx, x, y = stack.pop()
+            wx, wy = idx % nx, idx // nx
+            if distance <= wx < nx-distance and distance <= wy < ny-distance:
+                found = unseen.intersection(map(idx.__add__, shifts))
+                if found:
+                    unseen.difference_update(found)
+                    for other in found:
+                        dx, dy = deltas[other-idx]
+                        component.append((x+dx, y+dy, states[other]))
+                        stack.append((other, x+dx, y+dy))
+                continue
+            for dx, dy, offset in offsets:
+                ox, oy = wx+dx, wy+dy
+                if wrap:
+                    ox, oy = ox % nx, oy % ny
+                elif not (0 <= ox < nx and 0 <= oy < ny):
+                    continue
+                other = oy*nx + ox
+                if other in unseen:
+                    unseen.discard(other)
+                    component.append((x+dx, y+dy, states[other]))
+                    stack.append((other, x+dx, y+dy))
+        components.append(component)
+    return components
+
+
+def get_live_indices(state_map):
+    """ Indices of the cells of a StateMap not in the default state """
+    default_state = state_map._default_state
+    try:
+        import numpy as np
+    except ImportError:
+        return list(compress(count(), map(default_state.__ne__,
+                                          state_map._data)))
+    return np.flatnonzero(np.asarray(state_map.get_buffer()) !=
+                          default_state).tolist()
+
+
+class _MotifGame(Game):
+    """ Game running a motif on an unbounded plane (see build_index) """
+    std_colormap = {}
+    std_button_action_map = {}
+
+
+def get_phases(cells, rules, default_state, distance, max_period):
+    """
+    Returns the forms (canonical) of the phases of a motif, given as
+    its cells (dx, dy, state), until it repeats. Motifs which do not
+    repeat within max_period generations only have their first phase.
+    """
+    first = canonical_form(cells)
+    try:
+        game = _MotifGame(None, None, [], rules=rules,
+                          default_state=default_state,
+                          largest_neighbour_distance=get_rules_radius(rules),
+                          engine=None, unbounded=True)
+    except ValueError as e:
+        logger.debug('Motifs not propagated (%s)', e)
+        return [first]
+    game._state.redefine_cells(cells)
+    phases = [first]
+    for generation in xrange(max_period):
+        game.propagate()
+        cells = game._state.get_cells()
+        if not cells:
+            break
+        # Of a gun, only the gun (its largest component) repeats
+        x0, y0, x1, y1 = game._state.get_bounds()
+        nx, ny = x1-x0, y1-y0
+        states = dict([((y-y0)*nx + x-x0, state) for x, y, state in cells])
+        largest = max(find_components(states, nx, ny, sorted(states),
+                                      distance, wrap=False), key=len)
+        form = canonical_form(largest)
+        if form == first:
+            return phases
+        phases.append(form)
+    return [first]
+
+
+def build_index(rules, default_state=0, distance=None, motif_dir=MOTIF_DIR,
+                max_period=64):
+    """
+    Returns {canonical form: motif name} of the phases of the motifs
+    (state files named <name>.txt) in motif_dir under rules
+    """
+    if distance is None:
+        distance = 2*max(get_rules_radius(rules), 1)
+    index = {}
+    for path in sorted(glob.glob(os.path.join(motif_dir, '*.txt'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        cells = get_pattern_cells(path, default_state, transparent=True)
+        if not cells:
+            continue
+        for form in get_phases(cells, rules, default_state, distance,
+                               max_period):
+            if index.get(form, name) != name:
+                logger.debug('%s has the same phase as %s', name,
+                             index[form])
+                continue
+            index[form] = name
+    return index
+
+
+def get_scan_size(state_map):
+    """
+    Number of cells looked at by a full census of state_map: the
+    whole game plan, or the chunks in use of a ChunkedStateMap
+    """
+    if isinstance(state_map, ChunkedStateMap):
+        return len(state_map.get_chunk_population())*state_map.chunk_size**2
+    return state_map._nx*state_map._ny
+
+
+class Census(object):
+    """
+    Counts the components of a StateMap by motif name, see update
+    """
+    # A full census is done when more than 1/scan_ratio of the cells
+    # it would look at (see get_scan_size) were touched, a touched
+    # cell costing about as much as scan_ratio cells of a full one
+    scan_ratio = 256
+
+    def __init__(self, index, distance=2):
+        self._distance = distance
+        # Every orientation of the indexed forms, so that looking up
+        # a component only needs normalize
+        self._names = {}
+        for form, name in index.items():
+            cells = [(x, y, state) for y, x, state in form]
+            for oriented in get_orientations(cells):
+                self._names.setdefault(oriented, name)
+        self._counts = Counter()
+        # Component id -> (cells (x, y, state), name) and the
+        # component of each cell (x, y)
+        self._components = {}
+        self._owner = {}
+        self._next_id = 0
+        # Cells touched since the last update, None means all
+        self._touched = None
+
+    def name(self, cells):
+        """ The motif name of a component (x, y, state) """
+        return self._names.get(normalize(cells), UNKNOWN)
+
+    def touch(self, cells):
+        """
+        Mark cells (x, y) as changed since the last update, None
+        marks all cells
+        """
+        if cells is None:
+            self._touched = None
+        elif self._touched is not None:
+            self._touched.update(cells)
+
+    @property
+    def counts(self):
+        return +self._counts
+
+    def _add(self, component, nx, ny):
+        cid = self._next_id
+        self._next_id += 1
+        name = self.name(component)
+        self._components[cid] = (component, name)
+        self._counts[name] += 1
+        owner = self._owner
+        if nx is None:
+            for x, y, state in component:
+                owner[(x, y)] = cid
+        else:
+            for x, y, state in component:
+                owner[(x % nx, y % ny)] = cid
+
+    def _remove(self, cid):
+        component, name = self._components.pop(cid)
+        self._counts[name] -= 1
+        return component
+
+    def _recount(self, state_map):
+        """ Census of the whole map """
+        self._counts = Counter()
+        self._components, self._owner = {}, {}
+        default_state = state_map._default_state
+        distance = self._distance
+        if isinstance(state_map, ChunkedStateMap):
+            cells = state_map.get_cells()
+            if not cells:
+                return None
+            x0, y0, x1, y1 = state_map.get_bounds()
+            # Pad so that no neighbour falls outside the grid
+            x0, y0 = x0-distance, y0-distance
+            nx, ny = x1-x0+distance, y1-y0+distance
+            states = dict([((y-y0)*nx + x-x0, state)
+                           for x, y, state in cells])
+            for component in find_components(states, nx, ny, sorted(states),
+                                             distance, wrap=False):
+                self._add([(x+x0, y+y0, state) for x, y, state in component],
+                          None, None)
+            return None
+        nx, ny, data = state_map._nx, state_map._ny, state_map._data
+        for component in find_components(data, nx, ny,
+                                         get_live_indices(state_map),
+                                         distance):
+            self._add(component, nx, ny)
+
+    def update(self, state_map):
+        """
+        Returns the Counter of the components of state_map by motif
+        name, only the regions touched since the last update are
+        looked at again
+        """
+        touched, self._touched = self._touched, set()
+        if touched is None or \
+               len(touched) > get_scan_size(state_map)//self.scan_ratio:
+            # Cheaper to start over
+            self._recount(state_map)
+            return self.counts
+        if not touched:
+            return self.counts
+        nx, ny = state_map._nx, state_map._ny
+        if nx is None:
+            def wrap(x, y):
+                return x, y
+        else:
+            def wrap(x, y):
+                return x % nx, y % ny
+        distance = self._distance
+        box = [(dx, dy) for dy in xrange(-distance, distance+1)
+               for dx in xrange(-distance, distance+1)]
+        owner = self._owner
+        # Take apart the components near a touched cell and start
+        # over from their cells and the touched ones
+        affected = set()
+        for x, y in touched:
+            for dx, dy in box:
+                cid = owner.get(wrap(x+dx, y+dy))
+                if cid is not None:
+                    affected.add(cid)
+        seeds = set([wrap(x, y) for x, y in touched])
+        for cid in affected:
+            for x, y, state in self._remove(cid):
+                key = wrap(x, y)
+                del owner[key]
+                seeds.add(key)
+        query, default_state = state_map.query, state_map._default_state
+        offsets = [offset for offset in box if offset != (0, 0)]
+        for seed in seeds:
+            if seed in owner:
+                continue
+            state = query(*seed)
+            if state == default_state:
+                continue
+            x, y = seed
+            component, stack, seen = [(x, y, state)], [seed], set([seed])
+            while stack:
+                x, y = stack.pop()
+                for dx, dy in offsets:
+                    key = wrap(x+dx, y+dy)
+                    if key in seen:
+                        continue
+                    cid = owner.get(key)
+                    if cid is not None:
+                        # Joined to a component not taken apart
+                        for cx, cy, cstate in self._remove(cid):
+                            del owner[wrap(cx, cy)]
+                    state = query(*key)
+                    if state != default_state:
+                        seen.add(key)
+                        component.append((x+dx, y+dy, state))
+                        stack.append((x+dx, y+dy))
+            self._add(component, nx, ny)
+        return self.counts
@@ -0,0 +1,1532 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Simulation core of egolpy: StateMap, Game and Gol
+
+Nothing here depends on pygame (see GamePlan in egolpy_classes)
+and the optional parts (engines, snapshots, history, JSON) are
+imported on first use, so batch jobs and worker processes start
+quickly (see bench_startup.py).
+"""
+
+from __future__ import division
+
+import os,sys,logging
+
+from copy import copy
+from array import array
+from collections import deque, Counter
+from timeit import default_timer as clock
+from itertools import product
+
+from egolpy_rules import get_rules_radius, get_rules_hash, classify_rules, \
+     get_isolated_outcome, LIFE_LIKE, RADIUS_1, GENERAL
+
+if sys.version[0] == '3':
+    # For Python 3 compability
+    imap = map
+    xrange = range
+else:
+    from itertools import imap
+
+BLACK = (  0,   0,   0)
+WHITE = (255, 255, 255)
+RED   = (255,   0,   0)
+GREEN = (  0, 255,   0)
+
+logger = logging.getLogger('egol')
+
+# Alternative propagation engines: name -> (module, class)
+# the modules are imported on first use (they may depend on e.g. numpy)
+engines = {'numpy': ('egolpy_numpy', 'NumpyEngine'),
+           'hashlife': ('egolpy_hashlife', 'HashLifeEngine'),
+           'parallel': ('egolpy_parallel', 'ParallelEngine'),
+           'numba': ('egolpy_numba', 'NumbaEngine'),
+           'bitlife': ('egolpy_bitlife', 'BitLifeEngine')}
+
+# Engines tried (in order) by engine='auto' for each class of rules
+fast_engines = {LIFE_LIKE: ['bitlife', 'numba', 'numpy'],
+                RADIUS_1: ['numba', 'numpy'],
+                GENERAL: ['numba', 'numpy']}
+
+def get_engine_class(name):
+    if not name in engines:
+        raise ValueError("Unknown engine: %s (choose from: %s)" % (
+            name, ", ".join(sorted(engines.keys()))))
+    module_name, class_name = engines[name]
+    return getattr(__import__(module_name), class_name)
+
+
+def select_engine(rules, nx, ny):
+    """
+    Returns (name, engine) of the first engine of fast_engines
+    available for the class of rules (see classify_rules), or
+    (None, None) for the Python loop
+    """
+    kind = classify_rules(rules)
+    for name in fast_engines[kind]:
+        try:
+            engine = get_engine_class(name)(rules, nx, ny)
+        except (ImportError, ValueError) as e:
+            logger.debug('Engine %s not used (%s)', name, e)
+            continue
+        logger.info('Using the %s engine for %s rules', name, kind)
+        return name, engine
+    logger.info('Using the Python loop for %s rules', kind)
+    return None, None
+
+
+# Neighbour shell stencils shared by all StateMaps (and engines)
+# of the same size: (nx, ny, nth) -> tuple of (dx, dy) offsets
+_shell_stencils = {}
+
+def get_shell_stencil(nx, ny, nth):
+    """
+    Returns the distinct (dx, dy) offsets (modulo nx, ny) of the
+    cells in neighbour shell `nth` of any cell on an nx*ny grid
+    """
+    key = (nx, ny, nth)
+    if not key in _shell_stencils:
+        result, seen = [], set()
+        for ox in range(-nth, nth+1):
+            for oy in (-nth, nth):
+                entry = ox % nx, oy % ny
+                if not entry in seen:
+                    seen.add(entry)
+                    result.append(entry)
+        for oy in range(-nth+1, nth):
+            for ox in (-nth, nth):
+                entry = ox % nx, oy % ny
+                if not entry in seen:
+                    seen.add(entry)
+                    result.append(entry)
+        _shell_stencils[key] = tuple(result)
+    return _shell_stencils[key]
+
+
+# Shell stencils of an unbounded plane: nth -> tuple of (dx, dy)
+_plane_stencils = {}
+
+def get_plane_stencil(nth):
+    """ As get_shell_stencil, for a plane without edges """
+    if not nth in _plane_stencils:
+        if nth == 0:
+            _plane_stencils[nth] = ((0, 0),)
+        else:
+            _plane_stencils[nth] = tuple(
+                [(ox, oy) for ox in range(-nth, nth+1) for oy in (-nth, nth)] +
+                [(ox, oy) for oy in range(-nth+1, nth) for ox in (-nth, nth)])
+    return _plane_stencils[nth]
+
+
+_MASK32 = 2**32-1
+_MASK64 = 2**64-1
+
+def zobrist_key(idx, state):
+    """
+    Pseudo random 64 bit key of cell idx being in `state`
+    (a splitmix64 hash, so no table of keys is stored)
+    """
+    z = (idx*0x9E3779B97F4A7C15 + (state+1)*0xD1B54A32D192ED03) & _MASK64
+    z = ((z ^ (z >> 30))*0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27))*0x94D049BB133111EB) & _MASK64
+    return z ^ (z >> 31)
+
+
+MOTIF_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'motifs')
+
+_patterns = {}
+
+def load_pattern(pattern):
+    """
+    Returns the rows of a pattern, given as rows, as a state file
+    or as the name of a file in motifs/ (e.g. 'glider')
+    """
+    if not isinstance(pattern, str):
+        return pattern
+    if not pattern in _patterns:
+        path = pattern
+        if not os.path.exists(path):
+            path = os.path.join(MOTIF_DIR, pattern + '.txt')
+        import json
+        ifh = open(path, 'rt')
+        _patterns[pattern] = json.load(ifh)
+        ifh.close()
+    return _patterns[pattern]
+
+def get_pattern_cells(pattern, default_state=0, rotation=0, reflect=False,
+                      transparent=False):
+    """
+    Returns the cells (dx, dy, state) of a pattern cropped to its
+    cells not in default_state, mirrored left to right if reflect
+    and then turned `rotation` quarter turns clockwise
+    """
+    rows = load_pattern(pattern)
+    live = [(x, y) for y, row in enumerate(rows)
+            for x, state in enumerate(row) if state != default_state]
+    if not live:
+        return []
+    x0, x1 = min([x for x, y in live]), max([x for x, y in live])
+    y0, y1 = min([y for x, y in live]), max([y for x, y in live])
+    width, height = x1-x0+1, y1-y0+1
+    cells = [(x-x0, y-y0, rows[y][x]) for y in xrange(y0, y1+1)
+             for x in xrange(x0, x1+1)
+             if not transparent or rows[y][x] != default_state]
+    if reflect:
+        cells = [(width-1-dx, dy, state) for dx, dy, state in cells]
+    for turn in xrange(rotation % 4):
+        cells = [(height-1-dy, dx, state) for dx, dy, state in cells]
+        width, height = height, width
+    return cells
+
+
+class StateMap(object):
+    """
+    StateMap class to be useful to games of
+    the same kind as Conway's Game of Life
+    """
+    __slots__ = ('_nx', '_ny', '_default_state',
+                 '_largest_neighbour_distance', '_data', '_back', '_pbc',
+                 '_redefined', '_all_redefined', '_changed', '_all_changed',
+                 '_hash', '_hash_delta', '_population', '_row_population')
+
+    def __init__(self, nx, ny, data=None, default_state=0, pbc=False,
+                 largest_neighbour_distance=1):
+        self._nx, self._ny = nx, ny
+        self._default_state = default_state
+        self._largest_neighbour_distance = largest_neighbour_distance
+        if data:
+            self._data = self._new_data(data)
+        else:
+            self._data = self._new_data(
+                [self._default_state]*(self._nx*self._ny))
+        # The next generation is written to the back buffer (see
+        # define_next) and becomes current when the buffers are swapped
+        self._back = self._data[:]
+
+        self._pbc = pbc # Periodic boundary conditions
+        # Cells redefined since the last call to
+        # get_redefined_since_last_call, None while not recorded
+        # (see record_redefined)
+        self._redefined = None
+        self._all_redefined = False
+        # Cells changed since the last call to get_frontier
+        # (all cells are considered changed at first)
+        self._changed = set()
+        self._all_changed = True
+        # Zobrist hash of the current generation, cells in the
+        # default state do not contribute (computed on first use)
+        self._hash = None
+        self._hash_delta = 0
+        # Number of cells per state and of cells not in the default
+        # state per row (counted on first use, see get_population)
+        self._population = None
+        self._row_population = None
+    def __copy__(self):
+        return StateMap(self._nx, self._ny, self._data[:],
+                        self._default_state, self._pbc,
+                        self._largest_neighbour_distance)
+
+    def _new_data(self, states):
+        """ Returns the container used to store states """
+        if isinstance(states, memoryview):
+            return states.tolist()
+        return list(states)
+
+    def get_buffer(self):
+        """
+        Returns the states (row by row) as a memoryview, this
+        is a copy unless the StateMap is array backed
+        """
+        return memoryview(array('l', self._data))
+
+    def get_nr_matching_nth_neighbours(self, x, y, match, nth):
+        nx, ny, data = self._nx, self._ny, self._data
+        nr = 0
+        for dx, dy in get_shell_stencil(nx, ny, nth):
+            if data[(y+dy) % ny*nx + (x+dx) % nx] == match: nr += 1
+        return nr
+
+    def query(self,x,y):
+        if x < self._nx and x >= 0 and \
+               y < self._ny and y >= 0:
+            return self._data[y*self._nx+x]
+        else:
+            if self._pbc:
+                # Periodic boundary conditions
+                if x >= self._nx:
+                    return self.query(x-self._nx,y)
+                if x < 0:
+                    return self.query(self._nx+x,y)
+                if y >= self._ny:
+                    return self.query(x,y-self._ny)
+                if y < 0:
+                    return self.query(x,self._ny+y)
+            else:
+                if x == self._nx or x == -1 or y == self._ny or y == -1:
+                    return self._default_state
+        raise ValueError("Out of bounds (x=%s, nx=%s, y=%s, ny=%s)." % (x,self._nx,y,self._ny))
+
+    def redefine(self, x, y, state):
+        idx = y*self._nx+x
+        old = self._data[idx]
+        if self._hash is not None:
+            self._hash ^= self._get_key(idx, old) ^ self._get_key(idx, state)
+        if self._population is not None and old != state:
+            self._count(y, old, state)
+        self._data[idx] = state
+        if self._redefined is not None:
+            self._redefined.append((x,y))
+        self._changed.add((x,y))
+
+    def redefine_cells(self, cells):
+        """
+        Redefine many cells, given as (x, y, state), at once. Only
+        cells actually changing are marked as changed.
+        """
+        nx = self._nx
+        self._redefine_indices([(y*nx+x, state) for x, y, state in cells])
+
+    def redefine_region(self, x0, y0, width, states):
+        """
+        Redefine the block of `width` columns with its upper left
+        corner at (x0, y0) to states (row by row), coordinates wrap
+        at the edges
+        """
+        nx, ny = self._nx, self._ny
+        if len(states) > nx*ny//8 and width <= nx and \
+               len(states) <= nx*ny:
+            return self._redefine_rows(x0, y0, width, states)
+        cols = [(x0+dx) % nx for dx in xrange(width)]
+        self._redefine_indices([
+            (((y0+i//width) % ny)*nx + cols[i % width], state)
+            for i, state in enumerate(states)])
+
+    def _redefine_rows(self, x0, y0, width, states):
+        """
+        redefine_region by slice assignment, for regions large enough
+        that all cells are marked as changed (and the hash and the
+        population recomputed on next use)
+        """
+        nx, ny, data = self._nx, self._ny, self._data
+        x0 = x0 % nx
+        # Columns up to the right edge, then the wrapped ones
+        right = min(width, nx-x0)
+        for i in xrange(0, len(states), width):
+            start = (y0 + i//width) % ny * nx
+            data[start+x0:start+x0+right] = \
+                self._new_data(states[i:i+right])
+            if right < width:
+                data[start:start+width-right] = \
+                    self._new_data(states[i+right:i+width])
+        self._hash = None
+        self._population, self._row_population = None, None
+        self._mark_all_redefined()
+        self._all_changed = True
+        self._changed = set()
+
+    def _redefine_indices(self, cells):
+        nx, data, get_key = self._nx, self._data, self._get_key
+        h = self._hash
+        count = self._count if self._population is not None else None
+        changed = []
+        for idx, state in cells:
+            old = data[idx]
+            if old != state:
+                data[idx] = state
+                changed.append((idx % nx, idx // nx))
+                if h is not None:
+                    h ^= get_key(idx, old) ^ get_key(idx, state)
+                if count is not None:
+                    count(idx // nx, old, state)
+        self._hash = h
+        if self._redefined is not None:
+            self._redefined.extend(changed)
+        if self._all_changed:
+            return None
+        if len(changed) > len(data)//8:
+            # Cheaper to evaluate every cell than the frontier
+            self._all_changed = True
+            self._changed = set()
+        else:
+            self._changed.update(changed)
+
+    def stamp(self, pattern, x, y, rotation=0, reflect=False,
+              transparent=False):
+        """ Stamp pattern (see stamp_many) at (x, y) """
+        self.stamp_many(pattern, [(x, y)], rotation, reflect, transparent)
+
+    def stamp_many(self, pattern, positions, rotation=0, reflect=False,
+                   transparent=False):
+        """
+        Stamp pattern (see load_pattern) with its upper left corner
+        at each of the positions (x, y), coordinates wrap at the
+        edges. The pattern is cropped to its cells not in the
+        default state, which are the only ones written if
+        transparent is True.
+        """
+        nx, ny = self._nx, self._ny
+        cells = get_pattern_cells(pattern, self._default_state, rotation,
+                                  reflect, transparent)
+        self._redefine_indices([
+            (((y+dy) % ny)*nx + (x+dx) % nx, state)
+            for x, y in positions for dx, dy, state in cells])
+
+    def _get_key(self, idx, state):
+        if state == self._default_state:
+            return 0
+        return zobrist_key(idx, state)
+
+    def rehash(self):
+        """ Recompute the hash from scratch, O(nx*ny) """
+        default_state = self._default_state
+        h = 0
+        for idx, state in enumerate(self._data):
+            if state != default_state:
+                h ^= zobrist_key(idx, state)
+        self._hash = h
+        self._hash_delta = 0
+
+    def _count(self, y, old, new):
+        """ Update the population for a cell in row y changing state """
+        population = self._population
+        population[old] -= 1
+        population[new] += 1
+        default_state = self._default_state
+        if old == default_state:
+            self._row_population[y] += 1
+        elif new == default_state:
+            self._row_population[y] -= 1
+
+    def recount(self):
+        """ Recount the population from scratch, O(nx*ny) """
+        nx, data, default_state = self._nx, self._data, self._default_state
+        self._population = Counter(data)
+        self._row_population = [nx - data[start:start+nx].count(default_state)
+                                for start in xrange(0, nx*self._ny, nx)]
+
+    def get_population(self):
+        """
+        Returns a Counter of the number of cells in each state (kept
+        up to date at O(1) per changed cell once first asked for)
+        """
+        if self._population is None:
+            self.recount()
+        return +self._population
+
+    def get_row_population(self):
+        """ Returns the number of cells not in the default state per row """
+        if self._population is None:
+            self.recount()
+        return self._row_population[:]
+
+    def get_occupied_rows(self):
+        """
+        Returns the (start, stop) ranges of consecutive rows having
+        cells not in the default state, e.g. to skip empty regions
+        """
+        rows = self.get_row_population()
+        ranges, start = [], None
+        for y, n in enumerate(rows):
+            if n and start is None:
+                start = y
+            elif not n and start is not None:
+                ranges.append((start, y))
+                start = None
+        if start is not None:
+            ranges.append((start, len(rows)))
+        return ranges
+
+    def get_hash(self):
+        """
+        Returns the 64 bit Zobrist hash of the current generation
+        (kept up to date at O(1) per changed cell)
+        """
+        if self._hash is None:
+            self.rehash()
+        return self._hash
+
+    def is_unchanged(self):
+        """ True if no cell changed since the last generation started """
+        return not (self._changed or self._all_changed)
+
+    def get_changed(self):
+        """
+        Returns the set of cells changed since the last generation
+        started, None means all cells
+        """
+        if self._all_changed:
+            return None
+        return self._changed
+
+    def restore(self, states):
+        """ Redefine the cells differing from states (row by row) """
+        nx, data = self._nx, self._data
+        for idx, state in enumerate(states):
+            if data[idx] != state:
+                self.redefine(idx % nx, idx // nx, state)
+
+    def clear_changed(self):
+        """ Forget the cells changed so far (see get_frontier) """
+        self._changed = set()
+        self._all_changed = False
+
+    def define_next(self, x, y, state):
+        """
+        Set the state of (x, y) in the next generation. Every cell
+        which may have changed since the last swap must be defined.
+        """
+        idx = y*self._nx+x
+        self._back[idx] = state
+        if state != self._data[idx]:
+            if self._hash is not None:
+                self._hash_delta ^= \
+                    self._get_key(idx, self._data[idx]) ^ \
+                    self._get_key(idx, state)
+            if self._population is not None:
+                # Counts the next generation already
+                self._count(y, self._data[idx], state)
+            if self._redefined is not None:
+                self._redefined.append((x,y))
+            self._changed.add((x,y))
+
+    def swap(self):
+        """ Make the next generation the current one """
+        self._data, self._back = self._back, self._data
+        if self._hash is not None:
+            self._hash ^= self._hash_delta
+        self._hash_delta = 0
+
+    def sync_back(self):
+        """
+        Copy the current generation to the back buffer, needed before
+        define_next after cells were changed without marking them as
+        changed since the last swap (e.g. by an engine)
+        """
+        self._back[:] = self._data
+
+    def get_frontier(self, radius):
+        """
+        Returns the set of cells within `radius` of a cell changed
+        since the last call (i.e. the only cells which may change
+        in the next generation), None means all cells
+        """
+        changed, self._changed = self._changed, set()
+        if self._all_changed:
+            self._all_changed = False
+            return None
+        nx, ny = self._nx, self._ny
+        frontier = set(changed)
+        for nth in range(1, radius+1):
+            stencil = get_shell_stencil(nx, ny, nth)
+            for x, y in changed:
+                frontier.update([((x+dx) % nx, (y+dy) % ny)
+                                 for dx, dy in stencil])
+        return frontier
+
+    def get_nth_neighbour_coordinates(self, x, y, nth):
+        nx, ny = self._nx, self._ny
+        return [((x+dx) % nx, (y+dy) % ny) for dx, dy in
+                get_shell_stencil(nx, ny, nth)]
+
+
+    def save(self, outfile, compression=None, generation=0,
+             rules_hash=None):
+        """
+        Save the states as JSON rows, or as a binary snapshot (see
+        egolpy_snapshot) if compression is given or outfile ends
+        with .egol
+        """
+        import egolpy_snapshot as snapshot
+        if compression is not None or \
+               os.path.splitext(outfile)[1] == snapshot.EXTENSION:
+            snapshot.write_snapshot(outfile, self._data, self._nx, self._ny,
+                                    self._pbc, self._default_state,
+                                    generation, rules_hash, compression)
+            return None
+        ofh = open(outfile,'wt')
+        dumpdata = [list(self._data[s:e]) for s,e in \
+                    zip(xrange(0,self._nx*(self._ny-1)+1,self._nx),
+                        xrange(self._nx,self._nx*self._ny+1,self._nx))]
+        import json
+        json.dump(dumpdata,ofh)
+        ofh.close()
+
+
+    def load(self, infile):
+        """
+        Load JSON rows or a binary snapshot (told apart by their
+        content), returns the snapshot header (None for JSON)
+        """
+        import egolpy_snapshot as snapshot
+        header = None
+        if snapshot.is_snapshot(infile):
+            header, data = snapshot.read_snapshot(infile)
+            if (header['nx'], header['ny']) != (self._nx, self._ny):
+                raise ValueError("%s is %dx%d, not %dx%d" % (
+                    infile, header['nx'], header['ny'], self._nx, self._ny))
+        else:
+            import json
+            ifh = open(infile, 'rt')
+            loaddata = json.load(ifh)
+            ifh.close()
+            data = []
+            for segm in loaddata:
+                data.extend(segm)
+        self._data = self._new_data(data)
+        self._back = self._data[:]
+        self._mark_all_redefined()
+        self._all_changed = True
+        self._hash = None
+        if self._population is not None:
+            self.recount()
+        return header
+
+
+    @property
+    def all_indices(self):
+        return product(*imap(xrange, [self._nx,self._ny]))
+
+
+    def record_redefined(self):
+        """
+        Start recording the cells redefined, for a consumer (e.g. a
+        display) calling get_redefined_since_last_call regularly
+        """
+        if self._redefined is None:
+            self._redefined = []
+
+    def _mark_all_redefined(self):
+        if self._redefined is not None:
+            self._redefined = []
+            self._all_redefined = True
+
+    def get_redefined_since_last_call(self):
+        """
+        Returns the cells (x, y) redefined since the last call, None
+        if all cells may have been (e.g. after load)
+        """
+        if self._redefined is None:
+            return []
+        if self._all_redefined:
+            self._all_redefined = False
+            self._redefined = []
+            return None
+        tmp = copy(self._redefined)
+        self._redefined = []
+        return tmp
+
+    def __str__(self):
+        nx, ny = self._nx, self._ny
+        rows = [self._data[start:stop] for (start,stop) in \
+            zip(range(0,nx*(ny-1)+1,nx),range(nx,nx*ny+1,nx))]
+        return "\n".join([" ".join([str(x) for x in row]) for row in rows])
+
+
+
+class CompactStateMap(StateMap):
+    """
+    StateMap storing one byte per cell (two bytes for more than
+    256 states) in an array, which is exposed with zero copies
+    by get_buffer
+    """
+    __slots__ = ('_typecode',)
+
+    def __init__(self, nx, ny, data=None, default_state=0, pbc=False,
+                 largest_neighbour_distance=1, nstates=256):
+        self._typecode = 'B' if nstates <= 256 else 'H'
+        super(CompactStateMap, self).__init__(nx, ny, data, default_state,
+                                              pbc,
+                                              largest_neighbour_distance)
+
+    def __copy__(self):
+        return CompactStateMap(self._nx, self._ny, self._data[:],
+                               self._default_state, self._pbc,
+                               self._largest_neighbour_distance,
+                               256 if self._typecode == 'B' else 65536)
+
+    def _new_data(self, states):
+        if isinstance(states, memoryview) and \
+               states.format == self._typecode:
+            # A single copy of e.g. a mmapped snapshot
+            data = array(self._typecode)
+            data.frombytes(states)
+            return data
+        return array(self._typecode, states)
+
+    def get_buffer(self):
+        return memoryview(self._data)
+
+
+class ChunkedStateMap(StateMap):
+    """
+    StateMap of an unbounded plane (coordinates may be negative),
+    stored as chunk_size x chunk_size chunks in a dict keyed by
+    chunk coordinates. A chunk is created when one of its cells
+    leaves the default state and dropped when they all return to
+    it, so memory scales with the area in use. Cells far from any
+    cell not in the default state are assumed to stay in it (see
+    Game, which checks the rules for this).
+    """
+    __slots__ = ('_chunks', '_chunk_population', '_next')
+
+    chunk_size = 64
+
+    def __init__(self, cells=None, default_state=0,
+                 largest_neighbour_distance=1):
+        self._nx, self._ny = None, None
+        self._default_state = default_state
+        self._largest_neighbour_distance = largest_neighbour_distance
+        self._pbc = False
+        self._data, self._back = None, None
+        # (cx, cy) -> states row by row, and number of cells not in
+        # the default state
+        self._chunks = {}
+        self._chunk_population = {}
+        # Changes to the next generation, see define_next
+        self._next = []
+        self._redefined = None
+        self._all_redefined = False
+        self._changed = set()
+        self._all_changed = True
+        self._hash = None
+        self._hash_delta = 0
+        self._population = None
+        self._row_population = None
+        if cells:
+            for x, y, state in cells:
+                self._set(x, y, state)
+
+    def __copy__(self):
+        return ChunkedStateMap(self.get_cells(), self._default_state,
+                               self._largest_neighbour_distance)
+
+    def _set(self, x, y, state):
+        """ Set the state of (x, y), returns True if it changed """
+        size = self.chunk_size
+        key = (x // size, y // size)
+        chunk = self._chunks.get(key)
+        default_state = self._default_state
+        if chunk is None:
+            if state == default_state:
+                return False
+            chunk = self._chunks[key] = [default_state]*(size*size)
+            self._chunk_population[key] = 0
+        idx = y % size * size + x % size
+        old = chunk[idx]
+        if old == state:
+            return False
+        chunk[idx] = state
+        if old == default_state:
+            self._chunk_population[key] += 1
+        elif state == default_state:
+            self._chunk_population[key] -= 1
+            if not self._chunk_population[key]:
+                del self._chunks[key]
+                del self._chunk_population[key]
+        if self._hash is not None:
+            idx = self._get_index(x, y)
+            self._hash ^= self._get_key(idx, old) ^ self._get_key(idx, state)
+        if self._population is not None:
+            self._count(y, old, state)
+        return True
+
+    def _get_index(self, x, y):
+        """ Index of (x, y) for the Zobrist keys """
+        return (y & _MASK32) << 32 | (x & _MASK32)
+
+    def query(self, x, y):
+        size = self.chunk_size
+        chunk = self._chunks.get((x // size, y // size))
+        if chunk is None:
+            return self._default_state
+        return chunk[y % size * size + x % size]
+
+    def get_nr_matching_nth_neighbours(self, x, y, match, nth):
+        size, chunks = self.chunk_size, self._chunks
+        default_matches = match == self._default_state
+        nr = 0
+        for dx, dy in get_plane_stencil(nth):
+            cx, cy = x+dx, y+dy
+            chunk = chunks.get((cx // size, cy // size))
+            if chunk is None:
+                if default_matches: nr += 1
+            elif chunk[cy % size * size + cx % size] == match:
+                nr += 1
+        return nr
+
+    def get_nth_neighbour_coordinates(self, x, y, nth):
+        return [(x+dx, y+dy) for dx, dy in get_plane_stencil(nth)]
+
+    def redefine(self, x, y, state):
+        self._set(x, y, state)
+        if self._redefined is not None:
+            self._redefined.append((x,y))
+        self._changed.add((x,y))
+
+    def redefine_cells(self, cells):
+        changed = [(x, y) for x, y, state in cells if self._set(x, y, state)]
+        if self._redefined is not None:
+            self._redefined.extend(changed)
+        if not self._all_changed:
+            self._changed.update(changed)
+
+    def redefine_region(self, x0, y0, width, states):
+        """
+        Redefine the block of `width` columns with its upper left
+        corner at (x0, y0) to states (row by row)
+        """
+        self.redefine_cells([(x0 + i % width, y0 + i // width, state)
+                             for i, state in enumerate(states)])
+
+    def stamp_many(self, pattern, positions, rotation=0, reflect=False,
+                   transparent=False):
+        """ See StateMap.stamp_many, without wrapping """
+        cells = get_pattern_cells(pattern, self._default_state, rotation,
+                                  reflect, transparent)
+        self.redefine_cells([(x+dx, y+dy, state) for x, y in positions
+                             for dx, dy, state in cells])
+
+    def get_cells(self):
+        """ Returns the cells (x, y, state) not in the default state """
+        size, default_state = self.chunk_size, self._default_state
+        return [(cx*size + idx % size, cy*size + idx // size, state)
+                for (cx, cy), chunk in self._chunks.items()
+                for idx, state in enumerate(chunk)
+                if state != default_state]
+
+    def get_bounds(self):
+        """
+        Returns (x0, y0, x1, y1), the smallest box (x1, y1 exclusive)
+        holding all cells not in the default state, None if empty
+        """
+        cells = self.get_cells()
+        if not cells:
+            return None
+        xs = [x for x, y, state in cells]
+        ys = [y for x, y, state in cells]
+        return min(xs), min(ys), max(xs)+1, max(ys)+1
+
+    def get_rows(self, bounds=None):
+        """ The states of the cells within bounds (see get_bounds) """
+        bounds = bounds or self.get_bounds()
+        if bounds is None:
+            return []
+        x0, y0, x1, y1 = bounds
+        return [[self.query(x, y) for x in xrange(x0, x1)]
+                for y in xrange(y0, y1)]
+
+    def get_chunk_population(self):
+        """
+        Returns {(cx, cy): number of cells not in the default state}
+        of the chunks in use, chunk (cx, cy) holding the cells with
+        x // chunk_size == cx and y // chunk_size == cy
+        """
+        return dict(self._chunk_population)
+
+    def rehash(self):
+        h = 0
+        for x, y, state in self.get_cells():
+            h ^= zobrist_key(self._get_index(x, y), state)
+        self._hash = h
+        self._hash_delta = 0
+
+    def recount(self):
+        """ Recount the population (rows are keys of a Counter) """
+        cells = self.get_cells()
+        self._population = Counter([state for x, y, state in cells])
+        self._row_population = Counter([y for x, y, state in cells])
+
+    def get_population(self):
+        """ Counter of the cells in each state but the default state """
+        population = super(ChunkedStateMap, self).get_population()
+        del population[self._default_state]
+        return population
+
+    def get_row_population(self):
+        """ Returns {y: number of cells not in the default state} """
+        if self._population is None:
+            self.recount()
+        return +self._row_population
+
+    def get_occupied_rows(self):
+        ranges = []
+        for y in sorted(self.get_row_population()):
+            if ranges and ranges[-1][1] == y:
+                ranges[-1] = (ranges[-1][0], y+1)
+            else:
+                ranges.append((y, y+1))
+        return ranges
+
+    def restore(self, states):
+        raise ValueError("An unbounded StateMap cannot be restored"
+                         " from rows")
+
+    def define_next(self, x, y, state):
+        """
+        Set the state of (x, y) in the next generation, only cells
+        which change are kept
+        """
+        if state != self.query(x, y):
+            self._next.append((x, y, state))
+            if self._redefined is not None:
+                self._redefined.append((x,y))
+            self._changed.add((x,y))
+
+    def swap(self):
+        for x, y, state in self._next:
+            self._set(x, y, state)
+        self._next = []
+
+    def get_frontier(self, radius):
+        """
+        Returns the set of cells within `radius` of a cell changed
+        since the last call (of any cell not in the default state
+        when all cells are considered changed)
+        """
+        changed, self._changed = self._changed, set()
+        if self._all_changed:
+            self._all_changed = False
+            changed = [(x, y) for x, y, state in self.get_cells()]
+        frontier = set(changed)
+        for nth in range(1, radius+1):
+            stencil = get_plane_stencil(nth)
+            for x, y in changed:
+                frontier.update([(x+dx, y+dy) for dx, dy in stencil])
+        return frontier
+
+    def save(self, outfile, compression=None, generation=0,
+             rules_hash=None):
+        """
+        Save the cells within get_bounds() as JSON, an object with
+        the origin (upper left corner), generation, rules_hash and
+        rows, or as a binary snapshot (see StateMap.save), which
+        does not keep the origin
+        """
+        import egolpy_snapshot as snapshot
+        bounds = self.get_bounds() or (0, 0, 0, 0)
+        rows = self.get_rows(bounds)
+        if compression is not None or \
+               os.path.splitext(outfile)[1] == snapshot.EXTENSION:
+            snapshot.write_snapshot(outfile, [s for row in rows for s in row],
+                                    bounds[2]-bounds[0], bounds[3]-bounds[1],
+                                    False, self._default_state, generation,
+                                    rules_hash, compression)
+            return None
+        import json
+        ofh = open(outfile, 'wt')
+        json.dump({'origin': list(bounds[:2]), 'generation': generation,
+                   'rules_hash': rules_hash, 'rows': rows}, ofh)
+        ofh.close()
+
+    def load(self, infile):
+        """
+        Load a file saved by save, or the rows of a StateMap state
+        file or snapshot (placed with their upper left corner at
+        (0, 0)). Returns the generation and rules_hash as a header
+        (None for plain rows).
+        """
+        import egolpy_snapshot as snapshot
+        header, x0, y0 = None, 0, 0
+        if snapshot.is_snapshot(infile):
+            header, data = snapshot.read_snapshot(infile)
+            nx = header['nx']
+            rows = [data[start:start+nx]
+                    for start in xrange(0, nx*header['ny'], nx)]
+        else:
+            import json
+            ifh = open(infile, 'rt')
+            rows = json.load(ifh)
+            ifh.close()
+            if isinstance(rows, dict):
+                header = {'generation': rows.get('generation', 0),
+                          'rules_hash': rows.get('rules_hash')}
+                (x0, y0), rows = rows['origin'], rows['rows']
+        old = [(x, y) for x, y, state in self.get_cells()]
+        self._chunks, self._chunk_population = {}, {}
+        self._next = []
+        self._hash = None
+        population, self._population = self._population, None
+        default_state = self._default_state
+        for y, row in enumerate(rows):
+            for x, state in enumerate(row):
+                if state != default_state:
+                    self._set(x0+x, y0+y, state)
+        if self._redefined is not None:
+            self._redefined = old + [(x, y)
+                                     for x, y, state in self.get_cells()]
+        self._changed = set()
+        self._all_changed = True
+        if population is not None:
+            self.recount()
+        return header
+
+    @property
+    def all_indices(self):
+        """ The cells of the chunks in use """
+        size = self.chunk_size
+        return [(cx*size + idx % size, cy*size + idx // size)
+                for cx, cy in list(self._chunks)
+                for idx in xrange(size*size)]
+
+    def __str__(self):
+        return "\n".join([" ".join([str(x) for x in row])
+                          for row in self.get_rows()])
+
+
+class CycleDetector(object):
+    """
+    Remembers the hashes of the last `window` generations and
+    reports the first repetition as cycle = (start, period)
+    """
+
+    def __init__(self, window=1024):
+        self._window = window
+        self.reset()
+
+    def reset(self):
+        self._seen = {}
+        self._order = deque()
+        self.cycle = None
+
+    def update(self, generation, state_hash, unchanged=False):
+        """
+        Record the hash of `generation`, unchanged=True means
+        no cell changed since the previous generation
+        """
+        if self.cycle is None:
+            if unchanged:
+                # Cheap still life signal
+                self.cycle = (generation-1, 1)
+            elif state_hash in self._seen:
+                start = self._seen[state_hash]
+                self.cycle = (start, generation-start)
+        if not state_hash in self._seen:
+            self._seen[state_hash] = generation
+        self._order.append((generation, state_hash))
+        if len(self._order) > self._window:
+            old_generation, old_hash = self._order.popleft()
+            if self._seen.get(old_hash) == old_generation:
+                del self._seen[old_hash]
+        return self.cycle
+
+
+class Game(object):
+    """
+    Remember to define a class variable 'std_rules'
+    """
+    # With engine='auto', generations following one in which fewer
+    # than nx*ny//frontier_ratio cells changed are propagated by the
+    # Python loop over the frontier instead of the engine (which
+    # evaluates every cell, at a fraction of the cost per cell)
+    frontier_ratio = 1024
+
+    def __init__(self, nx, ny, predefined_cells,
+         pbc=False, rules=None, default_state=0,
+         colormap=None, button_action_map=None,
+                 largest_neighbour_distance=1, engine='auto', compact=False,
+                 engine_options=None, unbounded=False):
+        if rules:
+            self._rules = rules
+        else:
+            self._rules = self.__class__.std_rules
+        if unbounded:
+            # nx, ny are not used, the plane grows as needed
+            if get_isolated_outcome(self._rules, default_state) != \
+                   default_state:
+                raise ValueError("An unbounded game plan needs rules"
+                                 " keeping empty space (default state"
+                                 " %s) empty" % default_state)
+            if engine not in (None, 'auto'):
+                raise ValueError("Engine %s needs a bounded game plan"
+                                 % engine)
+            engine = None
+            self._state = ChunkedStateMap(None, default_state,
+                                          largest_neighbour_distance)
+        elif compact:
+            self._state = CompactStateMap(nx, ny, None, default_state,
+                                          pbc, largest_neighbour_distance,
+                                          max(self._rules.keys())+1)
+        else:
+            self._state = StateMap(nx, ny, None, default_state, pbc,
+                                   largest_neighbour_distance)
+        if not rules:
+            self._state.redefine_cells(predefined_cells)
+        if colormap:
+            self._colormap = colormap
+        else:
+            self._colormap = self.__class__.std_colormap
+        if button_action_map:
+            self._button_action_map = button_action_map
+        else:
+            self._button_action_map = self.__class__.std_button_action_map
+        self._engine = None
+        self._auto_engine = engine == 'auto'
+        # True while the back buffer misses changes made by the engine
+        self._stale_back = False
+        if engine == 'auto':
+            # The fastest engine for this kind of rules
+            engine, self._engine = select_engine(self._rules, nx, ny)
+        elif engine:
+            try:
+                engine_class = get_engine_class(engine)
+            except ImportError as e:
+                # e.g. numba or numpy missing, behave as without engine
+                logger.warning('Engine %s unavailable (%s), using the'
+                               ' Python loop', engine, e)
+            else:
+                self._engine = engine_class(self._rules, nx, ny,
+                                            **(engine_options or {}))
+        # Only cells this close to a changed cell may change (by the
+        # rules, largest_neighbour_distance may understate it)
+        self._radius = get_rules_radius(self._rules)
+        self._generation = 0
+        self._cycles = None
+        self._history = None
+        self._instrumentation = None
+        self._census = None
+
+
+    def propagate(self):
+        if self._instrumentation is not None:
+            return self._propagate_instrumented()
+        self._propagate()
+        self._generation += 1
+        self._bookkeeping()
+
+    def _bookkeeping(self):
+        if self._census is not None:
+            self._census.touch(self._state.get_changed())
+        if self._cycles is not None:
+            self._cycles.update(self._generation, self._state.get_hash(),
+                                self._state.is_unchanged())
+        if self._history is not None:
+            self._history.record(self._generation, self._state)
+
+    def _propagate_instrumented(self):
+        """ propagate, collecting statistics (see egolpy_instrument) """
+        instrumentation = self._instrumentation
+        record = instrumentation.begin(self._generation+1)
+        times = record['times']
+        state_map = self._state
+        # The changed cells are counted from the redefined ones
+        recording = state_map._redefined is not None
+        state_map.record_redefined()
+        nr_redefined = len(state_map._redefined)
+        start = clock()
+        if self._use_engine():
+            state_map.clear_changed()
+            self._engine.propagate(state_map)
+            record['evaluated'] = state_map._nx*state_map._ny
+            times['engine'] = clock() - start
+        else:
+            frontier = state_map.get_frontier(self._radius)
+            if frontier is None:
+                frontier = list(state_map.all_indices)
+            record['evaluated'] = len(frontier)
+            times['frontier'] = clock() - start
+            start = clock()
+            rule_hits = dict([(state, [0]*len(self._rules[state][0]))
+                              for state in self._rules])
+            default_hits = dict([(state, 0) for state in self._rules])
+            self._evaluate(frontier, rule_hits, default_hits)
+            record['rule_hits'] = rule_hits
+            record['default_hits'] = default_hits
+            times['rules'] = clock() - start
+            start = clock()
+            state_map.swap()
+            times['swap'] = clock() - start
+        record['changed'] = len(state_map._redefined) - nr_redefined
+        if not recording:
+            state_map._redefined = None
+        population = state_map.get_population()
+        record['population'] = dict([(state, population[state])
+                                     for state in self._rules])
+        start = clock()
+        self._generation += 1
+        self._bookkeeping()
+        times['bookkeeping'] = clock() - start
+
+    def instrument(self, *collectors):
+        """
+        Collect per generation statistics with the given collectors
+        (see egolpy_instrument), without collectors instrumentation
+        is turned off
+        """
+        if self._instrumentation is not None:
+            self._instrumentation.close()
+            self._instrumentation = None
+        if collectors:
+            from egolpy_instrument import Instrumentation
+            self._instrumentation = Instrumentation(collectors)
+        return self._instrumentation
+
+    @property
+    def instrumentation(self):
+        return self._instrumentation
+
+    def _use_engine(self):
+        """ True if the engine is to propagate the next generation """
+        if not self._engine:
+            return False
+        state_map = self._state
+        if self._auto_engine:
+            changed = state_map.get_changed()
+            if changed is not None and len(changed) < \
+                   state_map._nx*state_map._ny//self.frontier_ratio:
+                if self._stale_back:
+                    state_map.sync_back()
+                    self._stale_back = False
+                return False
+        self._stale_back = True
+        return True
+
+    def _propagate(self):
+        if self._use_engine():
+            self._state.clear_changed()
+            self._engine.propagate(self._state)
+            return None
+        frontier = self._state.get_frontier(self._radius)
+
+        # Loop over the cells which may have been affected
+        if frontier is None:
+            frontier = self._state.all_indices
+        self._evaluate(frontier)
+        self._state.swap()
+
+    def _evaluate(self, frontier, rule_hits=None, default_hits=None):
+        """
+        Apply the rules to the cells (x, y) of frontier, counting the
+        rule applied per state in rule_hits and default_hits if given
+        (see _propagate_instrumented)
+        """
+        # Read the last state, write the next one to the back buffer
+        state_map = self._state
+        for x, y in frontier:
+            state = state_map.query(x,y)
+            cur_state_rules, default_outcome = self._rules[state]
+            new_state = None
+            for rule in cur_state_rules:
+                i0, ie, match, outcome = rule
+                cumsum = 0
+                for nth in range(i0, ie):
+                    cumsum += state_map.get_nr_matching_nth_neighbours(x,
+                                 y, match, nth)
+                if cumsum in outcome:
+                    new_state = outcome[cumsum]
+                    if rule_hits is not None:
+                        rule_hits[state][cur_state_rules.index(rule)] += 1
+                    break # Do not investigate any more rules
+            if new_state == None:
+                new_state = default_outcome
+                if default_hits is not None:
+                    default_hits[state] += 1
+            state_map.define_next(x, y, new_state)
+
+
+    def jump(self, k):
+        """
+        Propagate 2^k generations, at once if the engine
+        supports it (e.g. hashlife)
+        """
+        if self._engine and hasattr(self._engine, 'jump'):
+            self._state.clear_changed()
+            self._engine.jump(self._state, k)
+            self._generation += 2**k
+            if self._census is not None:
+                self._census.touch(self._state.get_changed())
+            if self._cycles is not None:
+                # Only every 2^k:th generation is seen, so a
+                # reported period is a multiple of the true one
+                self._cycles.update(self._generation,
+                                    self._state.get_hash())
+            if self._history is not None:
+                self._history.record(self._generation, self._state)
+        else:
+            for generation in xrange(2**k):
+                self.propagate()
+
+    def census(self):
+        """
+        Returns a Counter of the objects on the game plan by motif
+        name (see egolpy_census), after the first call only the
+        regions changed since the last one are looked at again
+        """
+        if self._census is None:
+            from egolpy_census import Census, build_index
+            distance = 2*max(self._radius, 1)
+            self._census = Census(build_index(
+                self._rules, self._state._default_state, distance), distance)
+        return self._census.update(self._state)
+
+    def detect_cycles(self, window=1024):
+        """
+        Start looking for cycles among the (hashes of the) last
+        `window` generations, see the cycle property
+        """
+        self._cycles = CycleDetector(window)
+        self._cycles.update(self._generation, self._state.get_hash())
+
+    def stamp(self, pattern, x, y, rotation=0, reflect=False,
+              transparent=False):
+        """ Stamp a pattern at (x, y), see StateMap.stamp_many """
+        self.stamp_many(pattern, [(x, y)], rotation, reflect, transparent)
+
+    def stamp_many(self, pattern, positions, rotation=0, reflect=False,
+                   transparent=False):
+        self._state.stamp_many(pattern, positions, rotation, reflect,
+                               transparent)
+        edited = []
+        if self._history is not None or self._census is not None:
+            cells = get_pattern_cells(pattern, self._state._default_state,
+                                      rotation, reflect, transparent)
+            edited = [(x+dx, y+dy) for x, y in positions
+                      for dx, dy, state in cells]
+        if self._history is not None:
+            nx, ny = self._state._nx, self._state._ny
+            edited = [(x % nx, y % ny) for x, y in edited]
+        self._edited(edited)
+
+    def _edited(self, cells):
+        """ Bookkeeping after cells were changed outside propagate """
+        if self._census is not None:
+            self._census.touch(cells)
+        if self._history is not None:
+            self._history.amend(self._generation, self._state, cells)
+        if self._cycles is not None:
+            # The earlier generations no longer lead to this one
+            self._cycles.reset()
+            self._cycles.update(self._generation, self._state.get_hash())
+
+    def save(self, outfile, compression=None):
+        """ Save the game plan, see StateMap.save """
+        self._state.save(outfile, compression, self._generation,
+                         get_rules_hash(self._rules))
+
+    def load(self, infile):
+        """
+        Load a game plan, a snapshot also restores the generation
+        """
+        header = self._state.load(infile)
+        if header is not None:
+            if header['rules_hash'] not in (None,
+                                            get_rules_hash(self._rules)):
+                logger.warning('%s was saved with other rules', infile)
+            self._generation = header['generation']
+        if self._census is not None:
+            self._census.touch(None)
+        self.reset_history()
+
+    def keep_history(self, keyframe_interval=64, max_bytes=64*2**20):
+        """
+        Keep past generations (within max_bytes) so that the game
+        can be rewound, see egolpy_history
+        """
+        from egolpy_history import History
+        if isinstance(self._state, ChunkedStateMap):
+            raise ValueError("History needs a bounded game plan")
+        self._history = History(keyframe_interval, max_bytes)
+        self._history.record(self._generation, self._state)
+
+    def reset_history(self):
+        """ Forget the past, e.g. after loading a new game plan """
+        if self._history is not None:
+            self._history.reset()
+            self._history.record(self._generation, self._state)
+        if self._cycles is not None:
+            self._cycles.reset()
+            self._cycles.update(self._generation, self._state.get_hash())
+
+    @property
+    def history(self):
+        return self._history
+
+    def rewind(self, generation):
+        """ Go back (or forward) to a generation kept in the history """
+        self._state.restore(self._history.get_states(generation))
+        self._generation = generation
+        if self._census is not None:
+            self._census.touch(None)
+        if self._cycles is not None:
+            self._cycles.reset()
+            self._cycles.update(self._generation, self._state.get_hash())
+
+    def step_back(self):
+        """
+        Go back to the previous kept generation, returns False
+        if there is none
+        """
+        if self._history is None:
+            return False
+        earlier = [g for g in self._history.generations
+                   if g < self._generation]
+        if not earlier:
+            return False
+        self.rewind(earlier[-1])
+        return True
+
+    def export_history(self, start, stop, pattern):
+        """
+        Save the kept generations from start to stop to the
+        files pattern % generation
+        """
+        return self._history.export(start, stop, pattern, self._state._nx)
+
+    @property
+    def cycle(self):
+        """ (start generation, period) of a detected cycle or None """
+        if self._cycles is None:
+            return None
+        return self._cycles.cycle
+
+    @property
+    def generation(self):
+        return self._generation
+
+    @property
+    def population(self):
+        """ Counter of the number of cells in each state """
+        return self._state.get_population()
+
+    def run(self, generations, on_cycle=None):
+        """
+        Propagate a number of generations. When cycles are detected
+        (see detect_cycles) on_cycle='stop' stops at the first cycle
+        and on_cycle='skip' fast-forwards over whole periods.
+        Returns the number of generations propagated (or skipped)
+        """
+        if on_cycle is not None and self._cycles is not None:
+            done = 0
+            while done < generations:
+                self.propagate()
+                done += 1
+                if self.cycle is None:
+                    continue
+                if on_cycle == 'stop':
+                    break
+                remaining = generations - done
+                skipped = remaining - remaining % self.cycle[1]
+                self._generation += skipped
+                done += skipped
+            return done
+        if self._engine and hasattr(self._engine, 'jump'):
+            # generations in binary, one jump per bit set
+            remaining, k = generations, 0
+            while remaining:
+                if remaining & 1:
+                    self.jump(k)
+                remaining >>= 1
+                k += 1
+        else:
+            for generation in xrange(generations):
+                self.propagate()
+        return generations
+
+DEAD, ALIVE = 0, 1
+
+def inverter(state, *args):
+    return {DEAD: ALIVE,
+        ALIVE: DEAD}.get(state)
+
+def state_setter(state, *args):
+    return args[0][0]
+
+class Gol(Game):
+    """
+    Conway's Game of Life
+    http://en.wikipedia.org/wiki/Conway%27s_Game_of_Life
+
+    Rules of Conway's game of life:
+
+        1. Any live cell with fewer than two live
+           neighbours dies, as if caused by under-population.
+        2. Any live cell with two or three live neighbours
+           lives on to the next generation.
+        3. Any live cell with more than three live neighbours
+           dies, as if by overcrowding.
+        4. Any dead cell with exactly three live neighbours
+           becomes a live cell, as if by reproduction.
+
+    """
+    std_rules = {DEAD:  ([
+                   (1,2,ALIVE, {3: ALIVE}),     # Rule 4.
+                 ], DEAD),     # Note: range(1,2) == [1]
+         ALIVE: ([
+                   (1,2,ALIVE, {2: ALIVE, # Rule 2
+                                3: ALIVE}), # Rule 2
+                 ], DEAD),   # catches rule 1 and 3
+             }
+
+
+    std_colormap = {ALIVE: WHITE,
+            DEAD: BLACK}
+
+
+    std_button_action_map = {(1,0,0): ('state_setter',
+                                   (ALIVE,)
+                                   ),
+                     (0,0,1): ('state_setter',
+                                   (DEAD,)
+                                   ),}
+
+    actions = {'inverter': inverter,
+               'state_setter': state_setter}
+
+    def __init__(self, nx, ny, alive_cells, pbc=False, rules=None,
+             colormap=None, button_action_map=None,
+                 largest_neighbour_distance=1, engine='auto', compact=False,
+                 engine_options=None, unbounded=False):
+        predefined_cells = [(x, y, ALIVE) for x,y in alive_cells]
+        default_state = DEAD
+        super(self.__class__, self).__init__(nx,
+                                  ny,
+                                  predefined_cells,
+                                  pbc,
+                                  rules,
+                                  default_state,
+                                  colormap,
+                                  button_action_map,
+                                  largest_neighbour_distance,
+                                  engine,
+                                  compact,
+                                  engine_options,
+                                  unbounded)
+
+
+    def get_color(self, x, y):
+        return self._colormap[self._state.query(x, y)]
+
+
+    def click(self, buttons, x, y):
+        """
+        Give the user the ability to kill or
+        create live cells by clicking
+        """
+        cur_state   = self._state.query(x, y)
+        action_name = self._button_action_map[buttons][0]
+        action      = self.__class__.actions[action_name]
+        action_args = self._button_action_map[buttons][1]
+        new_state   = action(cur_state, action_args)
+        self._state.redefine(x, y, new_state)
+        self._edited([(x, y)])
+
+    def click_many(self, clicks):
+        """ Perform many clicks (buttons, x, y) at once """
+        query = self._state.query
+        new_states = {}
+        for buttons, x, y in clicks:
+            action_name, action_args = self._button_action_map[buttons]
+            new_states[(x, y)] = self.__class__.actions[action_name](
+                new_states.get((x, y), query(x, y)), action_args)
+        self._state.redefine_cells([(x, y, state) for (x, y), state
+                                    in new_states.items()])
+        self._edited(list(new_states))
+
+    def __str__(self):
+        return self._state.__str__()
+
+    @property
+    def all_indices(self):
+        return self._state.all_indices
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Ensemble runs for egolpy
+
+Evolves a batch of game plans with the same rules together as one
+(batch, ny, nx) array (see NumpyEngine.step), split into chunks over
+a pool of worker processes. Instead of the frames only statistics
+are kept per game plan: the population of each state over time,
+when the game plan died out and the period of the cycle it ended
+up in. E.g. for tuning rules:
+
+    python egolpy_ensemble.py 4gol.rules -x 64 -d 0.1 0.3 -s 100 -g 500
+"""
+
+from __future__ import division, print_function
+
+import os
+import sys
+import multiprocessing
+
+import numpy as np
+
+from egolpy_rules import compile_rules, load_rule_file
+from egolpy_core import CycleDetector
+from egolpy_numpy import NumpyEngine
+
+if sys.version[0] == '3':
+    xrange = range
+
+
+def random_boards(states, nx, ny, densities, seeds, default_state=0):
+    """
+    Returns a (len(densities)*len(seeds), ny, nx) array of random
+    game plans, a fraction `density` of the cells in one of the
+    states other than default_state
+    """
+    live = np.array([s for s in sorted(states) if s != default_state])
+    dtype = np.uint8 if max(states) < 256 else np.int64
+    boards = []
+    for density in densities:
+        for seed in seeds:
+            rnd = np.random.RandomState(seed)
+            board = np.full((ny, nx), default_state, dtype=dtype)
+            alive = rnd.random_sample((ny, nx)) < density
+            board[alive] = rnd.choice(live, np.count_nonzero(alive))
+            boards.append(board)
+    return np.array(boards)
+
+
+def evolve(rules, boards, generations, default_state=0, window=1024):
+    """
+    Evolves boards (batch, ny, nx) `generations` generations,
+    returns a list of per board statistics (see run_ensemble)
+    """
+    batch, ny, nx = boards.shape
+    states = sorted(compile_rules(rules).states)
+    engine = NumpyEngine(rules, nx, ny)
+    population = np.zeros((batch, generations+1, len(states)),
+                          dtype=np.int64)
+    extinction = [None]*batch
+    detectors = [CycleDetector(window) for b in xrange(batch)]
+    grid = boards
+    for generation in xrange(generations+1):
+        if generation > 0:
+            grid = engine.step(grid)
+        for k, state in enumerate(states):
+            population[:, generation, k] = (grid == state).sum(axis=(1, 2))
+        empty = (grid == default_state).all(axis=(1, 2))
+        for b in xrange(batch):
+            if empty[b] and extinction[b] is None:
+                extinction[b] = generation
+            if detectors[b].cycle is None:
+                detectors[b].update(generation, hash(grid[b].tobytes()))
+    cycles = [detector.cycle for detector in detectors]
+    return [{'states': states, 'population': population[b],
+             'extinction': extinction[b],
+             'cycle_start': cycles[b][0] if cycles[b] else None,
+             'period': cycles[b][1] if cycles[b] else None}
+            for b in xrange(batch)]
+
+
+def _evolve_chunk(args):
+    return evolve(*args)
+
+
+def run_ensemble(rules, boards, generations, default_state=0,
+                 workers=None, chunk_size=None, window=1024):
+    """
+    Evolves the game plans boards (batch, ny, nx) `generations`
+    generations using `workers` processes (default: number of cpus).
+    Returns for each board a dict with
+      states:      the states, in the order of the population columns
+      population:  (generations+1, len(states)) cell counts
+      extinction:  first generation with only default_state, or None
+      cycle_start, period: of the cycle found, or None (cycles longer
+                   than `window` generations are not found)
+    """
+    boards = np.asarray(boards)
+    workers = workers or os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = max(1, -(-len(boards)//workers))
+    chunks = [(rules, boards[i:i+chunk_size], generations, default_state,
+               window) for i in xrange(0, len(boards), chunk_size)]
+    if workers == 1 or len(chunks) == 1:
+        results = [_evolve_chunk(chunk) for chunk in chunks]
+    else:
+        pool = multiprocessing.Pool(min(workers, len(chunks)))
+        try:
+            results = pool.map(_evolve_chunk, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    return [stats for result in results for stats in result]
+
+
+def main(rule_file, nx=64, ny=None, densities=(0.3,), seeds=10,
+         generations=200, workers=None):
+    rules = load_rule_file(rule_file)[0]
+    boards = random_boards(rules.keys(), nx, ny or nx, densities,
+                           range(seeds))
+    results = run_ensemble(rules, boards, generations, workers=workers)
+    print('density seed extinction cycle_start period final_population')
+    for i, stats in enumerate(results):
+        print('%7.3f %4d %10s %11s %6s %s' % (
+            densities[i // seeds], i % seeds, stats['extinction'],
+            stats['cycle_start'], stats['period'],
+            ' '.join(['%d:%d' % (s, n) for s, n in
+                      zip(stats['states'], stats['population'][-1])])))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('rule_file', type=str, help="Rule file to use")
+    parser.add_argument('-x', '--nx', type=int, default=64,
+                        help="Number of cells on the width")
+    parser.add_argument('-y', '--ny', type=int, default=None,
+                        help="Number of cells on the height (default nx)")
+    parser.add_argument('-d', '--densities', type=float, nargs='+',
+                        default=[0.3], help="Initial live cell densities")
+    parser.add_argument('-s', '--seeds', type=int, default=10,
+                        help="Number of random seeds per density")
+    parser.add_argument('-g', '--generations', type=int, default=200,
+                        help="Number of generations")
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help="Number of worker processes")
+    args = parser.parse_args()
+    main(**vars(args))
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+HashLife engine for two-state rules with a neighbour radius of 1
+(e.g. Gol.std_rules and gol.rules)
+
+The game plan is stored as a quadtree of canonical (hash consed)
+nodes, and the result of advancing a node is memoized, which lets
+repetitive patterns be advanced 2^k generations at once.
+
+The game plan of a StateMap is periodic (neighbour coordinates
+wrap), so it is imported by tiling it over a node large enough
+that the center of the result covers the whole game plan. Nodes
+only repeat if nx and ny have large power-of-two factors, e.g.
+64x64 or 96x96 (3x3 tiles of 32x32), other sizes are refused.
+"""
+
+from __future__ import division
+
+import sys
+import logging
+
+from egolpy_rules import compile_rules, get_life_rule
+
+if sys.version[0] == '3':
+    xrange = range
+
+logger = logging.getLogger('egol')
+
+
+def is_supported(compiled):
+    """ True if compiled rules have two states and radius <= 1 """
+    return len(compiled.states) == 2 and compiled.radius <= 1
+
+
+def get_nr_tiles(nx, ny):
+    """
+    Number of distinct large nodes of an nx*ny periodic game plan,
+    (nx/2^a)*(ny/2^b) with 2^a and 2^b the largest powers of two
+    dividing nx and ny
+    """
+    return (nx // (nx & -nx)) * (ny // (ny & -ny))
+
+
+class NodeLimitExceeded(Exception):
+    """ Raised by join when max_nodes nodes exist """
+
+
+class Node(object):
+    """
+    Canonical quadtree node, children are Nodes (or the cell
+    values 0 and 1 for level 1 nodes). Never create Nodes directly,
+    use HashLifeEngine.join.
+    """
+    __slots__ = ('level', 'nw', 'ne', 'sw', 'se')
+
+    def __init__(self, level, nw, ne, sw, se):
+        self.level = level
+        self.nw, self.ne, self.sw, self.se = nw, ne, sw, se
+
+
+class HashLifeEngine(object):
+    """
+    Propagates a StateMap using HashLife, jump advances it
+    2^k generations at once. At most max_nodes nodes are kept,
+    a jump needing more is split into two halves. Game plans of
+    more than max_tiles tiles (see get_nr_tiles) are refused.
+    """
+
+    def __init__(self, rules, nx, ny, max_nodes=2**20, max_tiles=64):
+        compiled = compile_rules(rules)
+        if not is_supported(compiled):
+            raise ValueError("HashLife needs two-state rules with a"
+                             " neighbour radius of 1")
+        if nx < 3 or ny < 3:
+            raise ValueError("HashLife needs a game plan of at least 3x3")
+        if get_nr_tiles(nx, ny) > max_tiles:
+            raise ValueError("HashLife needs game plan sizes with large"
+                             " power-of-two factors (%dx%d is %d tiles,"
+                             " at most %d)" % (nx, ny, get_nr_tiles(nx, ny),
+                                               max_tiles))
+        self._nx, self._ny = nx, ny
+        self._states = compiled.states
+        self._max_nodes = max_nodes
+        # New state index for (state index, number of live neighbours)
+        # where cells in the second state are counted as live
+        self._transitions = {}
+        for idx, counts_to_live in enumerate(get_life_rule(compiled)):
+            for live in range(9):
+                self._transitions[(idx, live)] = int(live in counts_to_live)
+        self._reset()
+
+    def _reset(self):
+        self._nodes = {}
+        self._results = {}
+        self._zero = [0]
+        for level in range(1, 64):
+            self._zero.append(self.join(*([self._zero[-1]]*4)))
+
+    def join(self, nw, ne, sw, se):
+        """ Returns the canonical node with the given children """
+        key = (nw, ne, sw, se)
+        node = self._nodes.get(key)
+        if node is None:
+            if len(self._nodes) >= self._max_nodes:
+                raise NodeLimitExceeded()
+            level = nw.level+1 if isinstance(nw, Node) else 1
+            node = self._nodes[key] = Node(level, nw, ne, sw, se)
+        return node
+
+    def center(self, node):
+        return self.join(node.nw.se, node.ne.sw, node.sw.ne, node.se.nw)
+
+    def _base(self, node):
+        """ Center 2x2 of a 4x4 node advanced one generation """
+        rows = [[node.nw.nw, node.nw.ne, node.ne.nw, node.ne.ne],
+                [node.nw.sw, node.nw.se, node.ne.sw, node.ne.se],
+                [node.sw.nw, node.sw.ne, node.se.nw, node.se.ne],
+                [node.sw.sw, node.sw.se, node.se.sw, node.se.se]]
+        new = []
+        for y in (1, 2):
+            for x in (1, 2):
+                live = sum(rows[y-1][x-1:x+2]) + sum(rows[y+1][x-1:x+2]) + \
+                       rows[y][x-1] + rows[y][x+1]
+                new.append(self._transitions[(rows[y][x], live)])
+        return self.join(*new)
+
+    def step(self, node, j):
+        """
+        Returns the center of node (one level down) advanced
+        2^j generations (j <= node.level-2)
+        """
+        key = (node, j)
+        result = self._results.get(key)
+        if result is not None:
+            return result
+        if node.level == 2:
+            result = self._base(node)
+        else:
+            join = self.join
+            nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+            # The 9 overlapping subnodes one level down
+            subnodes = [nw, join(nw.ne, ne.nw, nw.se, ne.sw), ne,
+                        join(nw.sw, nw.se, sw.nw, sw.ne),
+                        join(nw.se, ne.sw, sw.ne, se.nw),
+                        join(ne.sw, ne.se, se.nw, se.ne),
+                        sw, join(sw.ne, se.nw, sw.se, se.sw), se]
+            if j == node.level-2:
+                # Advance both halves of the way
+                s = [self.step(n, j-1) for n in subnodes]
+                j = j-1
+            else:
+                s = [self.center(n) for n in subnodes]
+            result = join(self.step(join(s[0], s[1], s[3], s[4]), j),
+                          self.step(join(s[1], s[2], s[4], s[5]), j),
+                          self.step(join(s[3], s[4], s[6], s[7]), j),
+                          self.step(join(s[4], s[5], s[7], s[8]), j))
+        self._results[key] = result
+        return result
+
+    def _build(self, data, x0, y0, level, cache):
+        """ Node of the periodic game plan with its corner at x0, y0 """
+        nx, ny = self._nx, self._ny
+        key = (x0 % nx, y0 % ny, level)
+        node = cache.get(key)
+        if node is None:
+            if level == 0:
+                node = 0 if data[key[1]*nx+key[0]] == self._states[0] \
+                       else 1
+            else:
+                half = 2**(level-1)
+                node = self.join(
+                    self._build(data, x0, y0, level-1, cache),
+                    self._build(data, x0+half, y0, level-1, cache),
+                    self._build(data, x0, y0+half, level-1, cache),
+                    self._build(data, x0+half, y0+half, level-1, cache))
+            cache[key] = node
+        return node
+
+    def _write(self, node, x0, y0, out):
+        """ Write the live cells of node at x0, y0 into out """
+        if x0 >= self._nx or y0 >= self._ny:
+            return None
+        if not isinstance(node, Node):
+            if node:
+                out[y0*self._nx+x0] = self._states[1]
+            return None
+        if node is self._zero[node.level]:
+            return None
+        half = 2**(node.level-1)
+        self._write(node.nw, x0, y0, out)
+        self._write(node.ne, x0+half, y0, out)
+        self._write(node.sw, x0, y0+half, out)
+        self._write(node.se, x0+half, y0+half, out)
+
+    def advance(self, data, k):
+        """
+        Returns data (a list of states, row by row) advanced 2^k
+        generations
+        """
+        try:
+            return self._advance(data, k)
+        except NodeLimitExceeded:
+            self._reset()
+            if k == 0:
+                raise MemoryError("HashLife needs more than %d nodes for"
+                                  " a generation" % self._max_nodes)
+            logger.debug('HashLife node limit reached, splitting a jump'
+                         ' of 2^%d generations', k)
+            return self.advance(self.advance(data, k-1), k-1)
+
+    def _advance(self, data, k):
+        # The result of a level m node is its center of size 2^(m-1)
+        # advanced up to 2^(m-2) generations
+        level = max(k+2, 2)
+        while 2**(level-1) < max(self._nx, self._ny):
+            level += 1
+        offset = -2**(level-2)
+        root = self._build(data, offset, offset, level, {})
+        result = self.step(root, k)
+        out = [self._states[0]]*(self._nx*self._ny)
+        self._write(result, 0, 0, out)
+        if len(self._nodes) > self._max_nodes:
+            self._reset()
+        return out
+
+    def jump(self, state_map, k):
+        """ Advance state_map 2^k generations """
+        nx = self._nx
+        data = state_map._data
+        new_data = self.advance(list(data), k)
+        for idx, (state, new_state) in enumerate(zip(data, new_data)):
+            if state != new_state:
+                state_map.redefine(idx % nx, idx // nx, new_state)
+
+    def propagate(self, state_map):
+        self.jump(state_map, 0)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Bounded generation history for egolpy
+
+Generations are stored as delta records (the indices and new states
+of the cells changed since the previous record) with a full keyframe
+every `keyframe_interval` records. When the records take more than
+`max_bytes` the oldest keyframe and its deltas are dropped.
+"""
+
+from __future__ import division
+
+import sys
+import json
+from array import array
+from bisect import bisect_left, bisect_right
+
+if sys.version[0] == '3':
+    xrange = range
+
+_INDEX_TYPECODE = 'I' if array('I').itemsize >= 4 else 'L'
+# Rough size of a record besides its arrays
+_RECORD_OVERHEAD = 128
+
+
+def get_state_typecode(states):
+    top = max(states) if len(states) else 0
+    if min(states or [0]) >= 0:
+        if top < 256:
+            return 'B'
+        if top < 65536:
+            return 'H'
+    return 'l'
+
+
+class History(object):
+    """
+    Ring buffer of past generations of a StateMap, see
+    Game.keep_history
+    """
+
+    def __init__(self, keyframe_interval=64, max_bytes=64*2**20):
+        self._keyframe_interval = keyframe_interval
+        self._max_bytes = max_bytes
+        self.reset()
+
+    def reset(self):
+        self._generations = []
+        # (indices or None for keyframes, states) per generation
+        self._records = []
+        self._since_keyframe = 0
+        self._nbytes = 0
+
+    @property
+    def generations(self):
+        """ The generations kept, oldest first """
+        return list(self._generations)
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def __contains__(self, generation):
+        i = bisect_left(self._generations, generation)
+        return i < len(self._generations) and \
+               self._generations[i] == generation
+
+    def _truncate(self, generation):
+        """ Forget the generations after `generation` """
+        i = bisect_right(self._generations, generation)
+        for indices, states in self._records[i:]:
+            self._nbytes -= self._get_size(indices, states)
+        del self._generations[i:], self._records[i:]
+        self._since_keyframe = 0
+        for indices, states in reversed(self._records):
+            if indices is None:
+                break
+            self._since_keyframe += 1
+
+    def _get_size(self, indices, states):
+        size = _RECORD_OVERHEAD + len(states)*states.itemsize
+        if indices is not None:
+            size += len(indices)*indices.itemsize
+        return size
+
+    def _append(self, generation, indices, states):
+        self._generations.append(generation)
+        self._records.append((indices, states))
+        self._nbytes += self._get_size(indices, states)
+        if indices is None:
+            self._since_keyframe = 0
+        else:
+            self._since_keyframe += 1
+        # Drop the oldest keyframe and its deltas, always keeping
+        # the latest keyframe
+        while self._nbytes > self._max_bytes:
+            keyframes = [i for i, (indices, states) in
+                         enumerate(self._records) if indices is None]
+            if len(keyframes) < 2:
+                break
+            for indices, states in self._records[:keyframes[1]]:
+                self._nbytes -= self._get_size(indices, states)
+            del self._generations[:keyframes[1]], \
+                self._records[:keyframes[1]]
+
+    def _keyframe(self, generation, state_map):
+        data = state_map._data
+        self._append(generation, None, array(get_state_typecode(data),
+                                             data))
+
+    def record(self, generation, state_map):
+        """
+        Record the current generation of state_map, the cells
+        changed since the previous record are taken from
+        StateMap.get_changed. Later generations are forgotten.
+        """
+        self._truncate(generation-1)
+        changed = state_map.get_changed()
+        if not self._records or changed is None or \
+               self._since_keyframe+1 >= self._keyframe_interval:
+            return self._keyframe(generation, state_map)
+        nx, data = state_map._nx, state_map._data
+        indices = array(_INDEX_TYPECODE, sorted([y*nx+x for x, y in
+                                                 changed]))
+        self._append(generation, indices, array(
+            get_state_typecode([data[idx] for idx in indices]),
+            [data[idx] for idx in indices]))
+
+    def amend(self, generation, state_map, cells):
+        """
+        The cells (x, y) of the latest generation `generation`
+        were changed after it was recorded (e.g. by clicks)
+        """
+        self._truncate(generation)
+        if not self._records or self._generations[-1] != generation:
+            return self._keyframe(generation, state_map)
+        nx, data = state_map._nx, state_map._data
+        indices, states = self._records[-1]
+        self._nbytes -= self._get_size(indices, states)
+        new = [y*nx+x for x, y in cells]
+        if indices is None:
+            states = array(get_state_typecode(
+                list(states)+[data[idx] for idx in new]), states)
+            for idx in new:
+                states[idx] = data[idx]
+        else:
+            indices = array(_INDEX_TYPECODE, list(indices)+new)
+            states = array(get_state_typecode(
+                list(states)+[data[idx] for idx in new]),
+                list(states)+[data[idx] for idx in new])
+        self._records[-1] = (indices, states)
+        self._nbytes += self._get_size(indices, states)
+
+    def iter_states(self, start, stop):
+        """
+        Yields (generation, states) for the kept generations from
+        start to stop (inclusive), states is a list reused between
+        generations
+        """
+        first = bisect_left(self._generations, start)
+        last = bisect_right(self._generations, stop)
+        if first >= last:
+            return
+        i = first
+        while self._records[i][0] is not None:
+            i -= 1
+        states = list(self._records[i][1])
+        for j in xrange(i, last):
+            indices, record = self._records[j]
+            if indices is None:
+                states[:] = record
+            else:
+                for idx, state in zip(indices, record):
+                    states[idx] = state
+            if j >= first:
+                yield self._generations[j], states
+
+    def get_states(self, generation):
+        """ Returns the states of a kept generation (row by row) """
+        for kept, states in self.iter_states(generation, generation):
+            return states
+        raise KeyError(generation)
+
+    def export(self, start, stop, pattern, nx):
+        """
+        Writes the kept generations from start to stop in the
+        format of StateMap.save to the files pattern % generation,
+        returns the generations written
+        """
+        written = []
+        for generation, states in self.iter_states(start, stop):
+            ofh = open(pattern % generation, 'wt')
+            json.dump([states[s:s+nx] for s in
+                       xrange(0, len(states), nx)], ofh)
+            ofh.close()
+            written.append(generation)
+        return written
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Opt-in instrumentation of egolpy games (see Game.instrument)
+
+For every generation a record (a dict) is collected:
+
+    generation:   the generation propagated to
+    evaluated:    number of cells whose rules were evaluated
+    changed:      number of cells which changed
+    population:   {state: number of cells} after the generation
+    rule_hits:    {state: [number of cells per rule index]}
+    default_hits: {state: number of cells given the default outcome}
+    times:        {phase: seconds}, the phases being frontier, rules
+                  and swap (Python loop) or engine, then bookkeeping
+                  (cycle detection, history) and draw (GamePlan, the
+                  drawing done since the previous generation)
+
+Rule hits are only counted by the Python loop. Records are handed
+to collectors, i.e. objects with collect(record) and close().
+"""
+
+from __future__ import division
+
+import csv
+import json
+import logging
+from collections import deque
+
+logger = logging.getLogger('egol')
+
+PHASES = ('frontier', 'rules', 'swap', 'engine', 'bookkeeping', 'draw')
+
+
+class Instrumentation(object):
+    """
+    Collects the record of the current generation, records are
+    passed on when the next generation begins (so that e.g. the
+    drawing of a generation is included) or on flush
+    """
+
+    def __init__(self, collectors):
+        self.collectors = list(collectors)
+        self._record = None
+
+    def begin(self, generation):
+        self.flush()
+        self._record = {'generation': generation, 'evaluated': 0,
+                        'changed': 0, 'population': {}, 'rule_hits': {},
+                        'default_hits': {}, 'times': {}}
+        return self._record
+
+    def add_time(self, phase, seconds):
+        if self._record is not None:
+            times = self._record['times']
+            times[phase] = times.get(phase, 0) + seconds
+
+    def flush(self):
+        if self._record is not None:
+            for collector in self.collectors:
+                collector.collect(self._record)
+            self._record = None
+
+    def close(self):
+        self.flush()
+        for collector in self.collectors:
+            collector.close()
+
+
+class LoggerCollector(object):
+    """ Logs a summary of each record on the egol logger """
+
+    def __init__(self, level=logging.DEBUG):
+        self._level = level
+
+    def collect(self, record):
+        logger.log(self._level, 'Generation %d: %d evaluated, %d changed,'
+                   ' %s', record['generation'], record['evaluated'],
+                   record['changed'], ', '.join([
+                       '%s %.2f ms' % (phase, record['times'][phase]*1000)
+                       for phase in PHASES if phase in record['times']]))
+
+    def close(self):
+        pass
+
+
+class RingBufferCollector(object):
+    """ Keeps the last `size` records in memory (.records) """
+
+    def __init__(self, size=1024):
+        self.records = deque(maxlen=size)
+
+    def collect(self, record):
+        self.records.append(record)
+
+    def close(self):
+        pass
+
+
+class JsonLinesCollector(object):
+    """ Writes each record as a line of JSON """
+
+    def __init__(self, path):
+        self._ofh = open(path, 'wt')
+
+    def collect(self, record):
+        self._ofh.write(json.dumps(record, sort_keys=True) + '\n')
+
+    def close(self):
+        self._ofh.close()
+
+
+class CsvCollector(object):
+    """
+    Writes each record as a CSV row, the columns (population as
+    population_<state>, rule hits as rule_<state>_<index> and
+    default_<state>) are those of all records so far, values a
+    record does not have (e.g. rule hits of generations propagated
+    by an engine) are left empty. The file is rewritten when a
+    record brings new columns.
+    """
+
+    def __init__(self, path):
+        self._ofh = open(path, 'w+')
+        self._writer = csv.writer(self._ofh)
+        self._columns = None
+
+    def _flatten(self, record):
+        row = {'generation': record['generation'],
+               'evaluated': record['evaluated'],
+               'changed': record['changed']}
+        for phase in PHASES:
+            row['time_' + phase] = record['times'].get(phase, 0)
+        for state, n in record['population'].items():
+            row['population_%s' % state] = n
+        for state, hits in record['rule_hits'].items():
+            for i, n in enumerate(hits):
+                row['rule_%s_%d' % (state, i)] = n
+        for state, n in record['default_hits'].items():
+            row['default_%s' % state] = n
+        return row
+
+    def _set_columns(self, row):
+        """ Add the columns of row, rewriting the rows so far """
+        fixed = ['generation', 'evaluated', 'changed'] + \
+                ['time_' + phase for phase in PHASES]
+        old = self._columns or fixed
+        columns = fixed + sorted(set(old + list(row)) - set(fixed))
+        rows = []
+        if self._columns is not None:
+            self._ofh.seek(0)
+            rows = [dict(zip(old, values))
+                    for values in list(csv.reader(self._ofh))[1:]]
+            self._ofh.seek(0)
+            self._ofh.truncate()
+        self._columns = columns
+        self._writer.writerow(columns)
+        for values in rows:
+            self._writer.writerow([values.get(column, '')
+                                   for column in columns])
+
+    def collect(self, record):
+        row = self._flatten(record)
+        if self._columns is None or \
+               not set(row).issubset(self._columns):
+            self._set_columns(row)
+        self._writer.writerow([row.get(column, '')
+                               for column in self._columns])
+
+    def close(self):
+        self._ofh.close()
+
+
+def get_collector(target):
+    """
+    Collector for a command line target: 'log' for the logger,
+    *.csv for CSV and any other file name for JSON lines
+    """
+    if target == 'log':
+        return LoggerCollector(logging.INFO)
+    if target.endswith('.csv'):
+        return CsvCollector(target)
+    return JsonLinesCollector(target)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Numba compiled propagation engine for egolpy
+
+Runs the same rules as Game.propagate (ordered rule lists per
+state, shell sums over range(i0, ie) of cells matching a state,
+outcome maps and default outcomes) for arbitrary numbers of states
+and neighbour shells, as native loops over the compiled transition
+table (see egolpy_rules).
+
+Importing this module raises ImportError when numba is missing,
+in which case Game falls back to the plain Python loop.
+"""
+
+from __future__ import division
+
+import numpy as np
+from numba import njit
+
+from egolpy_rules import compile_rules
+from egolpy_core import get_shell_stencil
+
+
+@njit(cache=True)
+def _kernel(grid, new_grid, dxs, dys, shell_of, triples, valid,
+            offsets, ntriples, state_triples, sizes, strides, table):
+    """
+    Writes the next generation of grid to new_grid, returns -1
+    or the first state without rules found in grid
+    """
+    ny, nx = grid.shape
+    nstates = valid.shape[0]
+    # Number of cells of each state in each shell around a cell
+    shell_counts = np.zeros((nstates, shell_of[-1]+2), dtype=np.int64)
+    for y in range(ny):
+        for x in range(nx):
+            state = grid[y, x]
+            if state < 0 or state >= nstates or not valid[state]:
+                return state
+            shell_counts[:, :] = 0
+            for s in range(dxs.shape[0]):
+                neighbour = grid[(y+dys[s]) % ny, (x+dxs[s]) % nx]
+                if neighbour < nstates:
+                    shell_counts[neighbour, shell_of[s]] += 1
+            idx = offsets[state]
+            for j in range(ntriples[state]):
+                k = state_triples[state, j]
+                count = 0
+                for nth in range(triples[k, 0], triples[k, 1]):
+                    count += shell_counts[triples[k, 2], nth]
+                if count >= sizes[state, j]:
+                    count = sizes[state, j]-1
+                idx += count*strides[state, j]
+            new_grid[y, x] = table[idx]
+    return -1
+
+
+class NumbaEngine(object):
+    """
+    Propagates a StateMap with a compiled kernel evaluating
+    every cell, giving the same result as Game.propagate
+    """
+
+    def __init__(self, rules, nx, ny):
+        compiled = compile_rules(rules)
+        self._nx, self._ny = nx, ny
+        # Offsets of all shells used, shell_of giving the shell
+        top = max([ie for i0, ie, match in compiled.triples]+[1])
+        dxs, dys, shell_of = [], [], []
+        for nth in range(top):
+            for dx, dy in get_shell_stencil(nx, ny, nth):
+                dxs.append(dx)
+                dys.append(dy)
+                shell_of.append(nth)
+        self._dxs = np.array(dxs, dtype=np.int64)
+        self._dys = np.array(dys, dtype=np.int64)
+        self._shell_of = np.array(shell_of, dtype=np.int64)
+        self._triples = np.array(compiled.triples, dtype=np.int64).reshape(
+            (len(compiled.triples), 3))
+        nstates = max(compiled.states)+1
+        width = max([len(t) for t in compiled.state_triples.values()]+[1])
+        self._valid = np.zeros(nstates, dtype=np.bool_)
+        self._offsets = np.zeros(nstates, dtype=np.int64)
+        self._ntriples = np.zeros(nstates, dtype=np.int64)
+        self._state_triples = np.zeros((nstates, width), dtype=np.int64)
+        self._sizes = np.ones((nstates, width), dtype=np.int64)
+        self._strides = np.zeros((nstates, width), dtype=np.int64)
+        for state in compiled.states:
+            used = compiled.state_triples[state]
+            self._valid[state] = True
+            self._offsets[state] = compiled.offsets[state]
+            self._ntriples[state] = len(used)
+            self._state_triples[state, :len(used)] = used
+            self._sizes[state, :len(used)] = compiled.sizes[state]
+            self._strides[state, :len(used)] = compiled.strides[state]
+        self._table = np.array(compiled.table, dtype=np.int64)
+
+    def step(self, grid):
+        """
+        Returns the next generation of grid (an integer array of
+        shape (ny, nx))
+        """
+        new_grid = np.empty_like(grid)
+        missing = _kernel(grid, new_grid, self._dxs, self._dys,
+                          self._shell_of, self._triples, self._valid,
+                          self._offsets, self._ntriples,
+                          self._state_triples, self._sizes, self._strides,
+                          self._table)
+        if missing != -1:
+            raise KeyError(int(missing))
+        return new_grid
+
+    def propagate(self, state_map):
+        """
+        Propagates state_map one generation, cells are changed
+        through StateMap.redefine
+        """
+        nx = self._nx
+        grid = np.asarray(state_map.get_buffer()).reshape((self._ny, nx))
+        new_grid = self.step(grid)
+        for idx in np.flatnonzero(new_grid != grid):
+            state_map.redefine(int(idx % nx), int(idx // nx),
+                               int(new_grid.flat[idx]))
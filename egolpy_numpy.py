@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+NumPy based propagation engine for egolpy.
+
+The whole game plan is held as a (ny, nx) array. For every
+(i0, ie, match) triple occuring in the rules the number of
+matching cells in the neighbour shells range(i0, ie) is
+computed for all cells at once, after which the new states are
+looked up in the compiled transition table (see egolpy_rules).
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from egolpy_rules import compile_rules
+from egolpy_core import get_shell_stencil
+
+
+class NumpyEngine(object):
+    """
+    Propagates a StateMap using whole array operations,
+    giving the same result as Game.propagate evaluating
+    every cell.
+    """
+
+    def __init__(self, rules, nx, ny):
+        self._compiled = compile_rules(rules)
+        self._nx, self._ny = nx, ny
+        self._triples = self._compiled.triples
+        self._max_radius = {}
+        for i0, ie, match in self._triples:
+            self._max_radius[match] = max(
+                ie-1, self._max_radius.get(match, 0))
+        self._table = np.array(self._compiled.table, dtype=np.int64)
+
+    def _shell_count(self, mask, nth):
+        nx, ny = self._nx, self._ny
+        if nth == 0:
+            return mask.copy()
+        count = np.zeros_like(mask)
+        for dx, dy in get_shell_stencil(nx, ny, nth):
+            count += np.roll(mask, (-dy, -dx), axis=(-2, -1))
+        return count
+
+    def _box_counts(self, mask, radius):
+        """
+        Returns a list of square box counts with radius 0..radius
+        (only valid when 2*radius+1 <= min(nx, ny))
+        """
+        lead = [(0, 0)]*(mask.ndim-2)
+        padded = np.pad(mask, lead+[(radius, radius)]*2, mode='wrap')
+        integral = np.zeros(padded.shape[:-2]+(padded.shape[-2]+1,
+                                               padded.shape[-1]+1),
+                            dtype=mask.dtype)
+        integral[..., 1:, 1:] = padded.cumsum(axis=-2).cumsum(axis=-1)
+        ny, nx = mask.shape[-2:]
+        boxes = []
+        for r in range(radius+1):
+            y0, y1 = radius-r, radius+r+1
+            x0, x1 = radius-r, radius+r+1
+            boxes.append(integral[..., y1:y1+ny, x1:x1+nx] -
+                         integral[..., y0:y0+ny, x1:x1+nx] -
+                         integral[..., y1:y1+ny, x0:x0+nx] +
+                         integral[..., y0:y0+ny, x0:x0+nx])
+        return boxes
+
+    def get_counts(self, grid):
+        """
+        Returns a dict mapping each (i0, ie, match) triple of the
+        rules to an array of matching cell counts
+        """
+        counts = {}
+        masks, boxes_by_match = {}, {}
+        for i0, ie, match in self._triples:
+            if not match in masks:
+                masks[match] = (grid == match).astype(np.int32)
+            mask = masks[match]
+            if ie <= i0:
+                counts[(i0, ie, match)] = np.zeros_like(mask)
+            elif 2*(ie-1)+1 <= min(self._nx, self._ny):
+                # No shell wraps onto itself, use box differences
+                if not match in boxes_by_match:
+                    boxes_by_match[match] = self._box_counts(
+                        mask, self._max_radius[match])
+                boxes = boxes_by_match[match]
+                if i0 > 0:
+                    counts[(i0, ie, match)] = boxes[ie-1] - boxes[i0-1]
+                else:
+                    counts[(i0, ie, match)] = boxes[ie-1]
+            else:
+                cumsum = np.zeros_like(mask)
+                for nth in range(i0, ie):
+                    cumsum += self._shell_count(mask, nth)
+                counts[(i0, ie, match)] = cumsum
+        return counts
+
+    def step(self, grid):
+        """
+        Returns the next generation of grid (an integer array of
+        shape (ny, nx), or (batch, ny, nx) for many game plans)
+        """
+        compiled = self._compiled
+        counts = self.get_counts(grid)
+        new_grid = np.empty_like(grid)
+        for state in np.unique(grid):
+            state = int(state)
+            selected = grid == state
+            idx = np.full(np.count_nonzero(selected),
+                          compiled.offsets[state], dtype=np.int64)
+            for k, dim, stride in zip(compiled.state_triples[state],
+                                      compiled.sizes[state],
+                                      compiled.strides[state]):
+                count = counts[self._triples[k]][selected]
+                idx += np.minimum(count, dim-1)*stride
+            new_grid[selected] = self._table[idx]
+        return new_grid
+
+    def propagate(self, state_map):
+        """
+        Propagates state_map one generation, cells are changed
+        through StateMap.redefine
+        """
+        nx = self._nx
+        grid = np.asarray(state_map.get_buffer()).reshape((self._ny, nx))
+        new_grid = self.step(grid)
+        for idx in np.flatnonzero(new_grid != grid):
+            state_map.redefine(int(idx % nx), int(idx // nx),
+                               int(new_grid.flat[idx]))
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Multi-process propagation engine for egolpy
+
+The game plan is split into tiles which are propagated by a pool of
+worker processes. The current and the next generation live in two
+shared memory buffers, each worker reads its tiles together with a
+halo as wide as the rules' neighbour radius (wrapped at the edges)
+from the current buffer and writes the new states of the tiles to
+the next one. Only tile indices are sent to the workers.
+"""
+
+from __future__ import division
+
+import os
+import weakref
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from egolpy_rules import compile_rules
+from egolpy_numpy import NumpyEngine
+
+
+# Per worker process state (set by _init_worker)
+_worker = {}
+
+def _init_worker(names, shape, dtype, rules, tiles, radius):
+    shms = [shared_memory.SharedMemory(name=name) for name in names]
+    _worker['shms'] = shms # keep the mappings alive
+    _worker['buffers'] = [np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+                          for shm in shms]
+    _worker['rules'] = rules
+    _worker['tiles'] = tiles
+    _worker['radius'] = radius
+    _worker['engines'] = {}
+
+def _run_tile(tile_idx):
+    """ Propagate one tile from the current to the next buffer """
+    current, following = _worker['buffers']
+    ny, nx = current.shape
+    x0, x1, y0, y1 = _worker['tiles'][tile_idx]
+    r = _worker['radius']
+    # The tile and its halo (wrapped at the edges of the game plan)
+    rows = np.arange(y0-r, y1+r) % ny
+    cols = np.arange(x0-r, x1+r) % nx
+    padded = current[np.ix_(rows, cols)]
+    key = padded.shape
+    if not key in _worker['engines']:
+        _worker['engines'][key] = NumpyEngine(_worker['rules'],
+                                              key[1], key[0])
+    new = _worker['engines'][key].step(padded)
+    following[y0:y1, x0:x1] = new[r:r+y1-y0, r:r+x1-x0]
+
+
+def _cleanup(pool, shms):
+    pool.terminate()
+    for shm in shms:
+        shm.close()
+        shm.unlink()
+
+
+class ParallelEngine(object):
+    """
+    Propagates a StateMap in tiles of (at most) tile_size*tile_size
+    cells using `workers` processes (default: number of cpus)
+    """
+
+    def __init__(self, rules, nx, ny, workers=None, tile_size=256):
+        compiled = compile_rules(rules)
+        radius = compiled.radius
+        if 2*radius+1 > min(nx, ny):
+            raise ValueError("The neighbour shells wrap onto themselves"
+                             " on a %dx%d game plan" % (nx, ny))
+        self._nx, self._ny = nx, ny
+        self._dtype = np.uint8 if max(compiled.states) < 256 \
+                      else np.uint16
+        self._tiles = [(x0, min(x0+tile_size, nx), y0, min(y0+tile_size, ny))
+                       for y0 in range(0, ny, tile_size)
+                       for x0 in range(0, nx, tile_size)]
+        nbytes = nx*ny*np.dtype(self._dtype).itemsize
+        self._shms = [shared_memory.SharedMemory(create=True, size=nbytes)
+                      for i in range(2)]
+        self._buffers = [np.ndarray((ny, nx), dtype=self._dtype,
+                                    buffer=shm.buf) for shm in self._shms]
+        self._pool = multiprocessing.Pool(
+            workers or os.cpu_count(), _init_worker,
+            ([shm.name for shm in self._shms], (ny, nx), self._dtype,
+             rules, self._tiles, radius))
+        self._finalizer = weakref.finalize(self, _cleanup, self._pool,
+                                           self._shms)
+
+    def close(self):
+        """ Stop the worker processes and free the shared memory """
+        self._finalizer()
+
+    def propagate(self, state_map):
+        """
+        Propagates state_map one generation, cells are changed
+        through StateMap.redefine
+        """
+        nx = self._nx
+        current, following = self._buffers
+        current.flat[:] = np.asarray(state_map.get_buffer())
+        self._pool.map(_run_tile, range(len(self._tiles)))
+        for idx in np.flatnonzero(following != current):
+            state_map.redefine(int(idx % nx), int(idx // nx),
+                               int(following.flat[idx]))
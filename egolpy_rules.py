@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Rule handling for egolpy
+
+The rules dictionary:
+
+    {state: ([(i0, ie, match, outcome), ...], default_outcome)}
+
+is compiled into a flat integer transition table. For each
+state the distinct (i0, ie, match) triples used by its rules
+span a dense block of the table, indexed by the (clamped)
+counts of matching cells in the neighbour shells range(i0, ie).
+Looking up the new state of a cell is then a single index:
+
+    table[offsets[state] + sum(min(count_k, sizes_k-1)*strides_k)]
+"""
+
+from __future__ import division
+
+import os
+import sys
+import hashlib
+import logging
+from array import array
+
+if sys.version[0] == '3':
+    import pickle
+else:
+    import cPickle as pickle
+
+logger = logging.getLogger('egol')
+
+# Bump when the layout of CompiledRules changes (invalidates caches)
+COMPILED_FORMAT_VERSION = 1
+
+# Upper limit on the number of entries in the transition table
+MAX_TABLE_SIZE = 2**24
+
+
+def get_shell_size(nth):
+    """ Number of cells in neighbour shell nth (on a large board) """
+    return 1 if nth == 0 else 8*nth
+
+
+def get_max_count(i0, ie):
+    """ Largest possible count of cells in shells range(i0, ie) """
+    return sum([get_shell_size(nth) for nth in range(i0, ie)])
+
+
+def get_rules_radius(rules):
+    """ Largest neighbour shell used by rules """
+    radius = 0
+    for cur_state_rules, default_outcome in rules.values():
+        for i0, ie, match, outcome in cur_state_rules:
+            if ie > i0:
+                radius = max(radius, ie-1)
+    return radius
+
+
+class CompiledRules(object):
+    """
+    Flat transition table compiled from a rules dictionary
+
+    Attributes:
+    - `states`:   sorted tuple of states
+    - `triples`:  tuple of all distinct (i0, ie, match) triples
+    - `state_triples`: {state: tuple of indices into triples}
+    - `sizes`, `strides`: {state: tuple} per used triple
+    - `offsets`:  {state: start of the state's block in table}
+    - `table`:    array of new states
+    - `radius`:   largest neighbour shell used
+    - `rules_hash`: sha1 hex digest identifying the rules
+    """
+
+    def __init__(self, rules, rules_hash=None):
+        validate_rules(rules)
+        self.rules_hash = rules_hash or get_rules_hash(rules)
+        self.states = tuple(sorted(rules.keys()))
+        triples = []
+        self.state_triples, self.sizes, self.strides = {}, {}, {}
+        self.offsets = {}
+        self.radius = get_rules_radius(rules)
+        size = 0
+        for state in self.states:
+            cur_state_rules, default_outcome = rules[state]
+            used, largest_key = [], {}
+            for i0, ie, match, outcome in cur_state_rules:
+                triple = (i0, ie, match)
+                if not triple in triples:
+                    triples.append(triple)
+                if not triple in used:
+                    used.append(triple)
+                largest_key[triple] = max(
+                    [largest_key.get(triple, -1)]+list(outcome.keys()))
+            # Counts beyond the largest key of a triple never match,
+            # they are all clamped to one extra "no match" slot
+            sizes = tuple([min(largest_key[t]+2, get_max_count(t[0], t[1])+1)
+                           for t in used])
+            strides = []
+            stride = 1
+            for dim in reversed(sizes):
+                strides.insert(0, stride)
+                stride *= dim
+            self.state_triples[state] = tuple([triples.index(t)
+                                               for t in used])
+            self.sizes[state] = sizes
+            self.strides[state] = tuple(strides)
+            self.offsets[state] = size
+            size += stride
+        if size > MAX_TABLE_SIZE:
+            raise ValueError("Rules need a transition table of %d entries"
+                             " (limit: %d)" % (size, MAX_TABLE_SIZE))
+        self.triples = tuple(triples)
+        self.table = array('B' if max(self.states) < 256 else 'H',
+                           [0]*size)
+        for state in self.states:
+            self._fill(state, rules[state])
+
+    def _fill(self, state, state_rules):
+        cur_state_rules, default_outcome = state_rules
+        used = [self.triples[k] for k in self.state_triples[state]]
+        positions = [used.index((i0, ie, match)) for
+                     i0, ie, match, outcome in cur_state_rules]
+        sizes = self.sizes[state]
+        offset = self.offsets[state]
+        nentries = 1
+        for dim in sizes:
+            nentries *= dim
+        counts = [0]*len(sizes)
+        for idx in range(nentries):
+            # counts in row-major order of sizes
+            rem = idx
+            for k in range(len(sizes)-1, -1, -1):
+                counts[k] = rem % sizes[k]
+                rem //= sizes[k]
+            new_state = default_outcome
+            for pos, rule in zip(positions, cur_state_rules):
+                outcome = rule[3]
+                cumsum = counts[pos]
+                if cumsum in outcome:
+                    new_state = outcome[cumsum]
+                    break # Do not investigate any more rules
+            self.table[offset+idx] = new_state
+
+    def get_index(self, state, counts):
+        """
+        Returns the table index for a cell in `state` given counts,
+        a sequence with one count per entry of self.triples
+        """
+        idx = self.offsets[state]
+        for k, dim, stride in zip(self.state_triples[state],
+                                  self.sizes[state],
+                                  self.strides[state]):
+            count = counts[k]
+            idx += (count if count < dim else dim-1)*stride
+        return idx
+
+    def lookup(self, state, counts):
+        return self.table[self.get_index(state, counts)]
+
+
+def validate_rules(rules):
+    """ Raises ValueError if rules is not a valid rules dictionary """
+    if not rules:
+        raise ValueError("No rules given")
+    states = rules.keys()
+    for state in states:
+        if not isinstance(state, int) or state < 0:
+            raise ValueError("States must be non-negative integers,"
+                             " got: %r" % (state,))
+        try:
+            cur_state_rules, default_outcome = rules[state]
+        except (TypeError, ValueError):
+            raise ValueError("Rules of state %d must be a"
+                             " (rule list, default outcome) pair" % state)
+        if not default_outcome in states:
+            raise ValueError("Unknown default outcome %r of state %d" % (
+                default_outcome, state))
+        for rule in cur_state_rules:
+            try:
+                i0, ie, match, outcome = rule
+            except (TypeError, ValueError):
+                raise ValueError("Rule %r of state %d is not an"
+                                 " (i0, ie, match, outcome) tuple" % (
+                                     rule, state))
+            if not (isinstance(i0, int) and isinstance(ie, int)) or \
+                   i0 < 0 or ie < i0:
+                raise ValueError("Invalid shell range (%r, %r) in"
+                                 " rules of state %d" % (i0, ie, state))
+            if not match in states:
+                raise ValueError("Unknown match state %r in rules of"
+                                 " state %d" % (match, state))
+            for count, new_state in outcome.items():
+                if not isinstance(count, int) or count < 0:
+                    raise ValueError("Invalid count %r in rules of"
+                                     " state %d" % (count, state))
+                if not new_state in states:
+                    raise ValueError("Unknown outcome %r in rules of"
+                                     " state %d" % (new_state, state))
+
+
+def get_rules_hash(rules):
+    return hashlib.sha1(pickle.dumps(rules, 2)).hexdigest()
+
+
+_compiled_cache = {}
+
+def compile_rules(rules, rules_hash=None):
+    """
+    Returns CompiledRules for rules (memoized on the rules' hash)
+    """
+    if rules_hash is None:
+        rules_hash = get_rules_hash(rules)
+    if not rules_hash in _compiled_cache:
+        _compiled_cache[rules_hash] = CompiledRules(rules, rules_hash)
+    return _compiled_cache[rules_hash]
+
+
+def get_isolated_outcome(rules, state):
+    """
+    The next state of a cell in `state` with all cells around it
+    in that state too (on an unbounded plane)
+    """
+    cur_state_rules, default_outcome = rules[state]
+    for i0, ie, match, outcome in cur_state_rules:
+        cumsum = get_max_count(i0, ie) if match == state else 0
+        if cumsum in outcome:
+            return outcome[cumsum]
+    return default_outcome
+
+
+# Rule classes, see classify_rules
+LIFE_LIKE, RADIUS_1, GENERAL = 'life-like', 'radius-1', 'general'
+
+def classify_rules(rules):
+    """
+    Returns LIFE_LIKE for two-state rules using only the closest
+    neighbours (B/S rules), RADIUS_1 for other rules using only
+    the closest neighbours and GENERAL otherwise
+    """
+    compiled = compile_rules(rules)
+    if compiled.radius > 1:
+        return GENERAL
+    if len(compiled.states) == 2:
+        return LIFE_LIKE
+    return RADIUS_1
+
+
+def get_life_rule(compiled):
+    """
+    Returns the (birth, survival) sets of numbers of live
+    neighbours of LIFE_LIKE compiled rules, cells in the second
+    of the two states counting as live
+    """
+    dead, live = compiled.states
+    rule = []
+    for state in (dead, live):
+        counts_to_live = set()
+        for nr_live in range(9):
+            counts = []
+            for i0, ie, match in compiled.triples:
+                count = 0
+                if i0 == 0 and ie > 0 and match == state:
+                    count += 1
+                if i0 <= 1 < ie:
+                    count += nr_live if match == live else 8 - nr_live
+                counts.append(count)
+            if compiled.lookup(state, counts) == live:
+                counts_to_live.add(nr_live)
+        rule.append(frozenset(counts_to_live))
+    return tuple(rule)
+
+
+def load_rule_file(rule_file):
+    """
+    Loads (rules, colormap, button_action_map) from a pickled
+    rule file. The compiled rules are cached next to the rule
+    file (as <rule_file>.cache) keyed by the rules' hash.
+    """
+    rules, colormap, button_action_map = pickle.load(
+        open(rule_file, 'rb'))
+    rules_hash = get_rules_hash(rules)
+    if not rules_hash in _compiled_cache:
+        _compiled_cache[rules_hash] = _load_cached(rule_file, rules,
+                                                   rules_hash)
+    return rules, colormap, button_action_map
+
+
+def _load_cached(rule_file, rules, rules_hash):
+    cache_file = rule_file + '.cache'
+    key = (COMPILED_FORMAT_VERSION, rules_hash)
+    if os.path.exists(cache_file):
+        try:
+            cached_key, compiled = pickle.load(open(cache_file, 'rb'))
+            if cached_key == key:
+                return compiled
+        except Exception:
+            logger.debug('Ignoring unreadable rule cache: %s', cache_file)
+    compiled = CompiledRules(rules, rules_hash)
+    try:
+        ofh = open(cache_file, 'wb')
+        pickle.dump((key, compiled), ofh, 2)
+        ofh.close()
+    except (IOError, OSError):
+        logger.debug('Couldn\'t write rule cache: %s', cache_file)
+    return compiled
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Simulation server for egolpy (Python 3, asyncio)
+
+Runs a Game headless and streams it to any number of TCP clients.
+Messages in both directions are a 4 byte big endian length followed
+by the payload. The server sends
+
+    b'K' + <generation, nx, ny, typecode> + zlib(all cells)
+    b'D' + <generation, typecode, n> + zlib(n indices + n states)
+
+i.e. a keyframe when a client connects (or after the generation being
+propagated) and afterwards the cells changed since the last message
+it got. Generations are propagated in a worker thread, so that slow
+ones do not hold up serving the clients. Clients which do not keep up
+(more than max_buffer bytes unsent) skip generations: their changes
+are merged and sent once the client has caught up, as a keyframe if
+they cover much of the board. Clients send JSON commands, applied
+between generations:
+
+    {"cmd": "click", "buttons": [1, 0, 0], "x": 3, "y": 4}
+    {"cmd": "stamp", "pattern": "glider", "x": 3, "y": 4,
+     "rotation": 0, "reflect": false}
+
+where pattern is the name of a file in motifs/.
+"""
+
+from __future__ import division
+
+import os
+import json
+import zlib
+import struct
+import asyncio
+import logging
+import threading
+from array import array
+
+from egolpy_snapshot import get_typecode
+from egolpy_core import MOTIF_DIR
+
+logger = logging.getLogger('egol')
+
+LENGTH = struct.Struct('>I')
+KEYFRAME = struct.Struct('<QIIc')
+DELTA = struct.Struct('<QcI')
+
+
+def encode_keyframe(generation, nx, ny, states):
+    typecode = get_typecode(states)
+    return b'K' + KEYFRAME.pack(generation, nx, ny,
+                                typecode.encode('ascii')) + \
+           zlib.compress(array(typecode, states).tobytes(), 1)
+
+
+def encode_delta(generation, indices, states):
+    typecode = get_typecode(states)
+    return b'D' + DELTA.pack(generation, typecode.encode('ascii'),
+                             len(indices)) + \
+           zlib.compress(array('I', indices).tobytes() +
+                         array(typecode, states).tobytes(), 1)
+
+
+def decode_message(payload):
+    """
+    Returns ('K', generation, (nx, ny), states) or
+    ('D', generation, indices, states) for a server message
+    """
+    kind = payload[:1]
+    if kind == b'K':
+        generation, nx, ny, typecode = KEYFRAME.unpack_from(payload, 1)
+        states = array(typecode.decode('ascii'))
+        states.frombytes(zlib.decompress(payload[1+KEYFRAME.size:]))
+        return 'K', generation, (nx, ny), states
+    if kind == b'D':
+        generation, typecode, n = DELTA.unpack_from(payload, 1)
+        raw = zlib.decompress(payload[1+DELTA.size:])
+        indices, states = array('I'), array(typecode.decode('ascii'))
+        indices.frombytes(raw[:n*indices.itemsize])
+        states.frombytes(raw[n*indices.itemsize:])
+        return 'D', generation, indices, states
+    raise ValueError("Unknown message type %r" % kind)
+
+
+def write_message(writer, payload):
+    writer.write(LENGTH.pack(len(payload)) + payload)
+
+
+async def read_message(reader):
+    """ Returns the next payload, None when the connection closed """
+    try:
+        header = await reader.readexactly(LENGTH.size)
+        return await reader.readexactly(LENGTH.unpack(header)[0])
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+
+class _Client(object):
+
+    def __init__(self, writer):
+        self.writer = writer
+        # Indices changed since the last message, None: keyframe due
+        self.pending = None
+
+
+class SimulationServer(object):
+    """
+    Propagates game every `interval` seconds (back to back if 0)
+    and serves it on host:port
+    """
+
+    def __init__(self, game, host='127.0.0.1', port=7474, interval=0,
+                 max_buffer=2**20):
+        self._game = game
+        # The changed cells are sent to the clients, see step
+        game._state.record_redefined()
+        self._host, self._port = host, port
+        self.interval = interval
+        self._max_buffer = max_buffer
+        self._clients = []
+        self._commands = []
+        # Held while the game is changed or read
+        self._lock = threading.Lock()
+
+    async def _handle(self, reader, writer):
+        client = _Client(writer)
+        self._clients.append(client)
+        # Unless a generation is being propagated, in which case the
+        # keyframe is sent after it
+        if self._lock.acquire(False):
+            try:
+                self._send(client)
+            finally:
+                self._lock.release()
+        try:
+            while True:
+                payload = await read_message(reader)
+                if payload is None:
+                    break
+                try:
+                    self._commands.append(json.loads(payload.decode()))
+                except ValueError as e:
+                    logger.warning('Ignoring malformed command (%s)', e)
+        finally:
+            self._clients.remove(client)
+            writer.close()
+
+    def _send(self, client):
+        """ Send the client what it missed, unless it is behind """
+        if client.writer.transport.get_write_buffer_size() > \
+               self._max_buffer:
+            return None
+        state_map = self._game._state
+        data = state_map._data
+        if client.pending is None or \
+               len(client.pending) > len(data)//8:
+            write_message(client.writer, encode_keyframe(
+                self._game.generation, state_map._nx, state_map._ny, data))
+        elif client.pending:
+            indices = sorted(client.pending)
+            write_message(client.writer, encode_delta(
+                self._game.generation, indices,
+                [data[idx] for idx in indices]))
+        client.pending = set()
+
+    def _apply(self, command):
+        game = self._game
+        if command.get('cmd') in ('click', 'stamp'):
+            # Clients may only address cells of the game plan
+            x, y = command['x'], command['y']
+            nx, ny = game._state._nx, game._state._ny
+            if not (isinstance(x, int) and isinstance(y, int) and
+                    0 <= x < nx and 0 <= y < ny):
+                raise ValueError("Out of bounds (x=%r, nx=%s, y=%r, ny=%s)"
+                                 % (x, nx, y, ny))
+        if command.get('cmd') == 'click':
+            game.click_many([(tuple(command['buttons']), command['x'],
+                              command['y'])])
+        elif command.get('cmd') == 'stamp':
+            # Only the patterns in motifs/ can be stamped
+            name = command['pattern']
+            if os.path.basename(name) != name:
+                raise ValueError("Not a motif name: %r" % name)
+            game.stamp(os.path.join(MOTIF_DIR, name + '.txt'),
+                       command['x'], command['y'],
+                       command.get('rotation', 0),
+                       command.get('reflect', False))
+        else:
+            logger.warning('Unknown command %r', command.get('cmd'))
+
+    def step(self):
+        """ Apply the commands received and propagate a generation """
+        commands, self._commands = self._commands, []
+        self._broadcast(self._advance(commands))
+
+    def _advance(self, commands):
+        """
+        Apply commands and propagate a generation, returns the indices
+        of the cells changed (None: all), may run in a worker thread
+        """
+        with self._lock:
+            for command in commands:
+                try:
+                    self._apply(command)
+                except (KeyError, TypeError, ValueError, IOError) as e:
+                    logger.warning('Command %r failed (%s)', command, e)
+            self._game.propagate()
+            nx = self._game._state._nx
+            redefined = self._game._state.get_redefined_since_last_call()
+        if redefined is None:
+            return None
+        return set([y*nx+x for x, y in redefined])
+
+    def _broadcast(self, changed):
+        """ Send the clients the changed cells (see _advance) """
+        with self._lock:
+            for client in self._clients:
+                if changed is None:
+                    client.pending = None # keyframe due
+                elif client.pending is not None:
+                    client.pending |= changed
+                self._send(client)
+
+    async def run(self, generations=None):
+        """ Serve until `generations` generations are done (or forever) """
+        server = await asyncio.start_server(self._handle, self._host,
+                                            self._port)
+        logger.info('Serving on %s:%d', self._host, self._port)
+        loop = asyncio.get_running_loop()
+        done = 0
+        try:
+            while generations is None or done < generations:
+                # Commands are taken here, as clients add to them
+                commands, self._commands = self._commands, []
+                changed = await loop.run_in_executor(None, self._advance,
+                                                     commands)
+                self._broadcast(changed)
+                done += 1
+                await asyncio.sleep(self.interval)
+        finally:
+            server.close()
+            for client in self._clients:
+                client.writer.close()
+            await server.wait_closed()
+        return done
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Binary snapshots of egolpy game plans
+
+A snapshot is a 64 byte header (magic, format version, cell type,
+pbc, compression, default state, nx, ny, generation and the sha1 of
+the rules) followed by the cells row by row as little endian
+integers, optionally zlib or run-length compressed. Uncompressed
+snapshots are read through mmap without copying.
+"""
+
+from __future__ import division
+
+import sys
+import mmap
+import zlib
+import struct
+import binascii
+from array import array
+from itertools import groupby
+
+MAGIC = b'EGOLSNAP'
+VERSION = 1
+EXTENSION = '.egol'
+HEADER = struct.Struct('<8sBcBBiIIQ20s')
+HEADER_SIZE = 64
+COMPRESSIONS = {None: 0, 'zlib': 1, 'rle': 2}
+
+
+def get_typecode(states):
+    """ The smallest of the (fixed size) typecodes B, H and i """
+    if isinstance(states, array) and states.typecode in 'BH':
+        return states.typecode
+    if not len(states):
+        return 'B'
+    low, high = min(states), max(states)
+    if low >= 0 and high < 256:
+        return 'B'
+    if low >= 0 and high < 65536:
+        return 'H'
+    return 'i'
+
+
+def is_snapshot(path):
+    """ True if path is a binary snapshot (judged by its content) """
+    ifh = open(path, 'rb')
+    magic = ifh.read(len(MAGIC))
+    ifh.close()
+    return magic == MAGIC
+
+
+def _to_little_endian(data):
+    if sys.byteorder == 'big':
+        data = array(data.typecode, data)
+        data.byteswap()
+    return data
+
+
+def _encode_rle(data):
+    lengths, values = array('I'), array(data.typecode)
+    for value, run in groupby(data):
+        lengths.append(sum(1 for cell in run))
+        values.append(value)
+    return struct.pack('<I', len(lengths)) + \
+           _to_little_endian(lengths).tobytes() + \
+           _to_little_endian(values).tobytes()
+
+
+def _decode_rle(raw, typecode):
+    nruns = struct.unpack_from('<I', raw)[0]
+    lengths, values = array('I'), array(typecode)
+    start = struct.calcsize('<I')
+    lengths.frombytes(raw[start:start+nruns*lengths.itemsize])
+    start += nruns*lengths.itemsize
+    values.frombytes(raw[start:start+nruns*values.itemsize])
+    if sys.byteorder == 'big':
+        lengths.byteswap()
+        values.byteswap()
+    data = array(typecode)
+    for length, value in zip(lengths, values):
+        data.extend(array(typecode, [value])*length)
+    return data
+
+
+def write_snapshot(path, states, nx, ny, pbc=False, default_state=0,
+                   generation=0, rules_hash=None, compression=None):
+    """
+    Write states (a list or array, row by row) to path, rules_hash
+    is the hex digest from egolpy_rules.get_rules_hash
+    """
+    if not compression in COMPRESSIONS:
+        raise ValueError("Unknown compression %r" % (compression,))
+    typecode = get_typecode(states)
+    if not (isinstance(states, array) and states.typecode == typecode):
+        states = array(typecode, states)
+    if compression == 'rle':
+        raw = _encode_rle(states)
+    else:
+        raw = _to_little_endian(states).tobytes()
+        if compression == 'zlib':
+            raw = zlib.compress(raw, 1)
+    digest = binascii.unhexlify(rules_hash) if rules_hash else b''
+    header = HEADER.pack(MAGIC, VERSION, typecode.encode('ascii'),
+                         int(bool(pbc)), COMPRESSIONS[compression],
+                         default_state, nx, ny, generation, digest)
+    ofh = open(path, 'wb')
+    ofh.write(header + b'\0'*(HEADER_SIZE-len(header)))
+    ofh.write(raw)
+    ofh.close()
+
+
+def read_snapshot(path):
+    """
+    Returns (header, states) of the snapshot at path, header is a
+    dict and states a memoryview of the cells (a view into the
+    mmapped file unless the snapshot is compressed)
+    """
+    ifh = open(path, 'rb')
+    try:
+        fields = HEADER.unpack(ifh.read(HEADER.size))
+        if fields[0] != MAGIC:
+            raise ValueError("%s is not a snapshot" % path)
+        if fields[1] > VERSION:
+            raise ValueError("Snapshot format %d of %s is not supported"
+                             % (fields[1], path))
+        typecode = fields[2].decode('ascii')
+        # An all zero digest means no rules hash was saved, a sha1
+        # digest may well end with zero bytes
+        digest = fields[9] if fields[9].strip(b'\0') else None
+        header = {'typecode': typecode, 'pbc': bool(fields[3]),
+                  'compression': dict((v, k) for k, v in
+                                      COMPRESSIONS.items())[fields[4]],
+                  'default_state': fields[5], 'nx': fields[6],
+                  'ny': fields[7], 'generation': fields[8],
+                  'rules_hash': binascii.hexlify(digest).decode('ascii')
+                                if digest else None}
+        size = header['nx']*header['ny']*array(typecode).itemsize
+        if header['compression'] is None and sys.byteorder == 'little':
+            mapped = mmap.mmap(ifh.fileno(), 0, access=mmap.ACCESS_READ)
+            states = memoryview(mapped)[HEADER_SIZE:HEADER_SIZE+size]
+            return header, states.cast(typecode)
+        ifh.seek(HEADER_SIZE)
+        raw = ifh.read()
+    finally:
+        ifh.close()
+    if header['compression'] == 'rle':
+        data = _decode_rle(raw, typecode)
+    else:
+        if header['compression'] == 'zlib':
+            raw = zlib.decompress(raw)
+        data = array(typecode)
+        data.frombytes(raw[:size])
+        if sys.byteorder == 'big':
+            data.byteswap()
+    return header, memoryview(data)
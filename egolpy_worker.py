@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Background simulation for egolpy
+
+SimulationWorker propagates a Game in its own thread at its own rate
+while the pygame loop handles events and draws the latest finished
+generation. The game is only touched while holding the lock shared
+with the GamePlan, clicks reach the worker through a queue. After
+every generation the changed cells are published (see
+GamePlan.publish), drawing them does not need the lock.
+"""
+
+from __future__ import division
+
+import sys
+import time
+import threading
+
+if sys.version[0] == '3':
+    import queue
+else:
+    import Queue as queue
+
+
+class SimulationWorker(threading.Thread):
+    """
+    Propagates game one generation every `interval` seconds,
+    as fast as possible if interval is 0 (max speed), and calls
+    publish (if given) with the lock held after each change
+    """
+
+    def __init__(self, game, lock, interval=0.25, publish=None):
+        super(SimulationWorker, self).__init__()
+        self.daemon = True
+        self._game = game
+        self._lock = lock
+        self.interval = interval
+        self._publish = publish
+        self.paused = False
+        self._commands = queue.Queue()
+        self._stopped = False
+
+    def send_clicks(self, clicks):
+        """ Clicks (buttons, x, y) to perform before the next generation """
+        self._commands.put(('clicks', clicks))
+
+    def step(self):
+        """ Propagate one generation (e.g. while paused) """
+        self._commands.put(('step', None))
+
+    def stop(self):
+        self._stopped = True
+        self._commands.put(('stop', None))
+
+    def _execute(self, command, argument):
+        with self._lock:
+            if command == 'clicks':
+                self._game.click_many(argument)
+            elif command == 'step':
+                self._game.propagate()
+            if self._publish is not None:
+                self._publish()
+
+    def run(self):
+        next_time = time.time()
+        while not self._stopped:
+            if self.paused:
+                timeout = 0.05
+            else:
+                timeout = max(0, next_time - time.time())
+            try:
+                command, argument = self._commands.get(timeout=timeout)
+            except queue.Empty:
+                pass
+            else:
+                self._execute(command, argument)
+                continue
+            if self.paused or time.time() < next_time:
+                continue
+            with self._lock:
+                self._game.propagate()
+                if self._publish is not None:
+                    self._publish()
+            # Let the drawing thread take the lock
+            time.sleep(0)
+            next_time = max(next_time + self.interval, time.time()) \
+                        if self.interval else 0
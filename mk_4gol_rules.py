@@ -1,7 +1,7 @@
 import cPickle as pickle
 import json
 
-from egolpy_classes import DEAD, ALIVE, WHITE, BLACK, GREEN, RED
+from egolpy_core import DEAD, ALIVE, WHITE, BLACK, GREEN, RED
 
 ZOMBIE = 2
 MONSTER = 3
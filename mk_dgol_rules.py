@@ -5,7 +5,7 @@ else:
     import cPickle as pickle
 import json
 
-from egolpy_classes import DEAD, ALIVE, WHITE, BLACK, GREEN
+from egolpy_core import DEAD, ALIVE, WHITE, BLACK, GREEN
 
 ZOMBIE = 2
 
@@ -1,7 +1,7 @@
 import cPickle as pickle
 import json
 
-from egolpy_classes import DEAD, ALIVE, WHITE, BLACK
+from egolpy_core import DEAD, ALIVE, WHITE, BLACK
 
 rules = {DEAD:  ([
                    (1,2,ALIVE, {3: ALIVE}),     # Rule 4.
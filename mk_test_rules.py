@@ -1,7 +1,7 @@
 import cPickle as pickle
 import json
 
-from egolpy_classes import DEAD, ALIVE, WHITE, BLACK
+from egolpy_core import DEAD, ALIVE, WHITE, BLACK
 
 rules = {DEAD:  ([], DEAD),     # Note: range(1,2) == [1]
          ALIVE: ([